@@ -0,0 +1,961 @@
+"""性能基准脚本，使用 SDL dummy 视频/音频驱动无界面运行
+
+用法:
+    python benchmark.py blit [--frames 200] [--json]
+    python benchmark.py video-upload [--frames 120] [--json]
+    python benchmark.py audio [--runs 3] [--json]
+    python benchmark.py bundle [--runs 5] [--json]
+    python benchmark.py decode [--max-workers N] [--runs 3] [--json]
+    python benchmark.py puzzle [--grids 3 10 20] [--shapes rect jigsaw] [--ops 2000] [--json]
+    python benchmark.py input [--events-per-frame 40] [--frames 300] [--json]
+    python benchmark.py flow [--video-seconds 4] [--tracemalloc] [--output result.json]
+    python benchmark.py soak [--sessions 1000] [--max-growth-mb 8]
+    python benchmark.py tween [--fps 10 30 60 144] [--json]
+    python benchmark.py fade [--fps 60] [--json]
+"""
+import os
+import gc
+import sys
+import time
+import json
+import math
+import random
+import argparse
+import platform
+import contextlib
+import statistics
+import tempfile
+import subprocess
+import tracemalloc
+
+# 必须在导入 pygame 之前设置，才能在没有显示器的机器上运行
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+# 不打印 pygame 的欢迎信息，stdout 只输出结果
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+# 资源路径都是相对仓库根目录的
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import pygame
+import demo1
+
+
+def rss_mb():
+    """当前进程常驻内存 (MB)；没有 psutil 时 Linux 上读 /proc，其他系统退回到峰值常驻内存"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        # Linux 上单位是 KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_rss_mb():
+    """进程启动以来的峰值常驻内存 (MB)"""
+    try:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 上单位是字节，Linux 上是 KB
+        return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2**20
+
+
+def percentile(sorted_values, q):
+    """最近秩法百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def make_game(**kwargs):
+    return demo1.Game(**kwargs)
+
+
+def close_game(game):
+    game.cleanup()
+
+
+def settle(scene, frames=120):
+    """让场景的入场动画跑完，测的是稳定状态下的绘制开销；动画时间按 60 帧模拟"""
+    for i in range(frames):
+        scene.timeline.update(i / 60)
+        scene.update()
+
+
+def frame_clock(game, fps=60):
+    """按帧数计的模拟动画时钟：不限帧率地跑流程时，动画仍按每帧 1/fps 秒推进"""
+    return lambda: game.profiler.frame_count / fps
+
+
+def time_draw(scene, frames):
+    start = time.perf_counter()
+    for _ in range(frames):
+        scene.draw()
+    return (time.perf_counter() - start) / frames * 1e6
+
+
+def bench_blit(args):
+    """场景图中各场景 draw() 每帧耗时（视频除外）：未转换像素格式 vs 转换为显示格式（三种透明表示）"""
+    configs = [
+        ('raw', dict(convert_images=False)),
+        ('opaque', dict(transparency='opaque')),
+        ('colorkey', dict(transparency='colorkey')),
+        ('alpha', dict(transparency='alpha')),
+    ]
+    results = {}
+    for name, kwargs in configs:
+        game = make_game(**kwargs)
+        row = {}
+        for node in game.graph.nodes.values():
+            if node.scene_class is demo1.VideoScene:
+                continue
+            random.seed(0)
+            scene = game.scene(node.id)
+            scene.enter()
+            settle(scene)
+            row[node.id] = time_draw(scene, args.frames)
+            scene.exit()
+
+        # 单独测一次整屏背景 blit
+        background = game.assets.get_image(game.assets.list_images("assets/image")[0], (800, 600))
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            game.screen.blit(background, (0, 0))
+        row['background_blit'] = (time.perf_counter() - start) / args.frames * 1e6
+        results[name] = row
+        close_game(game)
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    columns = [name for name, _ in configs]
+    print(f"{'场景 (us/帧)':<24}" + "".join(f"{c:>12}" for c in columns))
+    for scene_name in results['raw']:
+        print(f"{scene_name:<24}" + "".join(f"{results[c][scene_name]:>12.1f}" for c in columns))
+
+
+def decode_frames(path, size, pix_fmt, count):
+    """用 ffmpeg 预先解码若干帧原始像素，基准中只测上传开销"""
+    depth = 4 if pix_fmt == 'bgra' else 3
+    frame_bytes = size[0] * size[1] * depth
+    cmd = [demo1.ffmpeg_binary(), '-loglevel', 'error', '-i', path, '-an',
+           '-frames:v', str(count), '-vf', 'scale=%d:%d:flags=lanczos' % tuple(size),
+           '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-']
+    data = subprocess.run(cmd, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, check=True).stdout
+    return [data[i:i + frame_bytes] for i in range(0, len(data) - frame_bytes + 1, frame_bytes)]
+
+
+def measure_upload(upload, frames, screen, pos):
+    """返回 (每帧微秒, 每帧 Python/numpy 堆分配块数, 每帧分配字节数, 每帧新建像素内存字节数)"""
+    # 预热一遍，排除首次调用的一次性开销
+    for frame in frames[:5]:
+        screen.blit(upload(frame)[0], pos)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    pixel_bytes = 0
+    start = time.perf_counter()
+    for frame in frames:
+        surface, created = upload(frame)
+        screen.blit(surface, pos)
+        pixel_bytes += created
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(max(0, stat.count_diff) for stat in stats)
+    allocated = sum(max(0, stat.size_diff) for stat in stats)
+    n = len(frames)
+    return elapsed / n * 1e6, blocks / n, allocated / n, pixel_bytes / n
+
+
+def bench_video_upload(args):
+    """视频帧上传：逐帧 make_surface 与预分配帧槽原地写入的对比（700x394）"""
+    import numpy as np
+    pygame.init()
+    screen = pygame.display.set_mode((800, 600))
+    size = demo1.VideoScene.video_size
+    width, height = size
+    pos = ((800 - width) // 2, 100)
+    path = demo1.VideoTranscodeCache.resolve(demo1.VideoScene.video_path, size, start=False)
+
+    # 旧方式：numpy 数组转置后 make_surface，每帧新建一个 Surface
+    rgb_frames = decode_frames(path, size, 'rgb24', args.frames)
+    def make_surface_upload(frame):
+        array = np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 3)
+        surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
+        return surface, surface.get_pitch() * surface.get_height()
+
+    # 新方式：帧数据写进预分配的缓冲区，共享这块内存的 Surface 只创建一次
+    pix_fmt, surface_format, _ = demo1.VideoDecoder.frame_format(screen)
+    slot_frames = rgb_frames if pix_fmt == 'rgb24' else decode_frames(path, size, pix_fmt, args.frames)
+    buffer = bytearray(len(slot_frames[0]))
+    slot_surface = pygame.image.frombuffer(buffer, size, surface_format)
+    slot_surface.set_alpha(None)
+    view = memoryview(buffer)
+    def slot_upload(frame):
+        # 解码线程中是 readinto 直接从管道读进缓冲区，这里用内存复制模拟
+        view[:] = frame
+        return slot_surface, 0
+
+    results = {}
+    for name, upload, frames in [('make_surface', make_surface_upload, rgb_frames),
+                                 (f'frame_slot_{pix_fmt}', slot_upload, slot_frames)]:
+        us, blocks, allocated, pixel_bytes = measure_upload(upload, frames, screen, pos)
+        results[name] = {
+            'us_per_frame': us,
+            'alloc_blocks_per_frame': blocks,
+            'alloc_bytes_per_frame': allocated,
+            'new_pixel_bytes_per_frame': pixel_bytes,
+        }
+    pygame.quit()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{len(rgb_frames)} 帧 {width}x{height}（上传 + blit）")
+    print(f"{'方式':<20}{'us/帧':>10}{'堆分配块/帧':>14}{'堆分配字节/帧':>16}{'新像素内存/帧':>16}")
+    for name, row in results.items():
+        print(f"{name:<20}{row['us_per_frame']:>10.1f}{row['alloc_blocks_per_frame']:>14.1f}"
+              f"{row['alloc_bytes_per_frame']:>16.0f}{row['new_pixel_bytes_per_frame']:>16.0f}")
+
+
+def audio_worker(mode):
+    """在独立进程里启动背景音乐，排除其他测量对内存的影响"""
+    pygame.mixer.init()
+    before = rss_mb()
+    start = time.perf_counter()
+    if mode == 'sound':
+        # 旧方式：整首 MP3 解码成 PCM 放进内存
+        music = pygame.mixer.Sound(demo1.Scene.music_path)
+        music.set_volume(0.3)
+        music.play(loops=-1)
+    else:
+        demo1.MusicPlayer(volume=0.3).play(demo1.Scene.music_path)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'start_ms': elapsed * 1000, 'rss_delta_mb': rss_mb() - before}))
+    pygame.mixer.quit()
+
+
+def bench_audio(args):
+    """背景音乐启动耗时与常驻内存：mixer.Sound 整体解码 vs mixer.music 流式播放"""
+    if args.worker:
+        audio_worker(args.worker)
+        return
+    results = {}
+    for mode in ('sound', 'music'):
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, __file__, 'audio', '--worker', mode],
+                                    stdout=subprocess.PIPE, check=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'方式':<10}{'启动 ms':>12}{'常驻内存增量 MB':>18}")
+    for mode, row in results.items():
+        print(f"{mode:<10}{row['start_ms']:>12.1f}{row['rss_delta_mb']:>18.1f}")
+
+
+def bundle_worker(bundle_path):
+    """在独立进程里冷启动游戏并进入所有图片场景；bundle_path 为空时从原图解码"""
+    start = time.perf_counter()
+    game = make_game(fast_start=True, asset_bundle=bundle_path or None)
+    # 只画第一帧，不调用 show_first_frame()：它会开始后台工作，检查视频转码副本（没有时启动
+    # libx264 转码）、预取下一场景，这些都和图片载入无关，会让计时和内存数字失真
+    game.render()
+    first_frame = time.perf_counter()
+    for node in game.graph.nodes.values():
+        if node.scene_class is demo1.VideoScene:
+            continue
+        scene = game.scene(node.id)
+        scene.enter()
+        scene.draw()
+        scene.exit()
+    done = time.perf_counter()
+    print(json.dumps({
+        'first_frame_ms': (first_frame - start) * 1000,
+        'all_scenes_ms': (done - start) * 1000,
+        'rss_mb': rss_mb(),
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+    close_game(game)
+
+
+def bench_bundle(args):
+    """预缩放图片包 vs 直接解码原图：冷启动到第一帧、载入所有场景的耗时和常驻内存"""
+    if args.worker is not None:
+        bundle_worker(args.worker)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "images.bundle")
+        with contextlib.redirect_stdout(sys.stderr):
+            demo1.Game.build_asset_bundle(path=path)
+        results = {}
+        for mode, bundle_path in (('files', ''), ('bundle', path)):
+            runs = []
+            for _ in range(args.runs):
+                output = subprocess.run([sys.executable, __file__, 'bundle', '--worker', bundle_path],
+                                        stdout=subprocess.PIPE, check=True, text=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            results[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'方式':<10}{'第一帧 ms':>12}{'全部场景 ms':>14}{'常驻内存 MB':>14}{'峰值 MB':>10}")
+    for mode, row in results.items():
+        print(f"{mode:<10}{row['first_frame_ms']:>12.1f}{row['all_scenes_ms']:>14.1f}"
+              f"{row['rss_mb']:>14.1f}{row['peak_rss_mb']:>10.1f}")
+
+
+def bundle_requests():
+    """生成图片包时要解码的全部 (路径, 尺寸)"""
+    graph = demo1.SceneGraph.load(demo1.SCENE_FILE)
+    requests = []
+    for node in graph.nodes.values():
+        requests.extend(node.scene_class.bundle_assets(node))
+    return list(dict.fromkeys((path, tuple(size)) for path, size in requests))
+
+
+def bench_decode(args):
+    """并行解码的扩展性：同一批图片用 1..N 个线程解码、缩放，和单线程比加速比"""
+    requests = bundle_requests()
+    max_workers = args.max_workers or os.cpu_count() or 1
+    results = {}
+    for workers in range(1, max_workers + 1):
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            demo1.AssetCache.decode_batch(requests, workers)
+            times.append((time.perf_counter() - start) * 1000)
+        results[workers] = statistics.median(times)
+    
+    base = results[1]
+    rows = {
+        workers: {'ms': ms, 'speedup': base / ms, 'efficiency': base / ms / workers}
+        for workers, ms in results.items()
+    }
+    if args.json:
+        print(json.dumps({'images': len(requests), 'cpu_count': os.cpu_count(), 'workers': rows}, indent=2))
+        return
+    print(f"{len(requests)} 张图片，CPU 核数 {os.cpu_count()}")
+    print(f"{'线程数':<8}{'耗时 ms':>12}{'加速比':>10}{'效率':>10}")
+    for workers, row in rows.items():
+        print(f"{workers:<8}{row['ms']:>12.1f}{row['speedup']:>10.2f}{row['efficiency']:>10.0%}")
+
+
+def time_each(func, args_list):
+    """逐个调用 func(*args)，返回每次调用的中位耗时 (微秒)"""
+    times = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e6
+
+
+def bench_puzzle(args):
+    """拼图引擎在 n x n 块时的拾取、拖动、吸附、局部重绘筛选和单块绘制耗时，以及拼图块在原图之外占用的内存；
+    拾取与逐块线性扫描对比，内存与每块复制一份像素的做法对比"""
+    rng = random.Random(0)
+    image = pygame.Surface((args.size, args.size))
+    image.fill((120, 160, 200))
+    image_kb = image.get_pitch() * image.get_height() / 1024
+    bounds = pygame.Rect(0, 0, 800, 600)
+    canvas = pygame.Surface(bounds.size)
+    results = {}
+    for n, shape in [(n, shape) for n in args.grids for shape in args.shapes]:
+        random.seed(0)
+        board = demo1.PuzzleBoard(image, (780 - args.size, 100), n, n, bounds, shape=shape)
+        board.shuffle()
+        # 一半的块拖到屏幕上的随机位置，模拟玩到一半、块互相重叠的局面
+        for piece in rng.sample(board.pieces, len(board.pieces) // 2):
+            board.move(piece, (rng.randrange(0, 800 - board.piece_w), rng.randrange(0, 600 - board.piece_h)))
+            board.raise_piece(piece)
+        points = [((rng.randrange(800), rng.randrange(600)),) for _ in range(args.ops)]
+        
+        def linear_pick(pos):
+            # 原来的做法：按层级从上到下逐块检查
+            for piece in reversed(board.order.values()):
+                if piece.rect.collidepoint(pos):
+                    return piece
+            return None
+        
+        pieces = [(rng.choice(board.pieces),) for _ in range(args.ops)]
+        moves = [(piece, (rng.randrange(0, 800 - board.piece_w), rng.randrange(0, 600 - board.piece_h)))
+                 for (piece,) in pieces]
+        nudges = [(piece, (piece.rect.x + 3, piece.rect.y + 2)) for (piece,) in pieces]
+        dirty = [(pygame.Rect(pos, (board.piece_w + 6, board.piece_h + 6)),) for (pos,) in points]
+        results[f"{n}x{n} {shape}"] = {
+            'pieces': len(board.pieces),
+            'extra_kb': board.pixel_bytes() / 1024,
+            'copy_per_piece_kb': image_kb,
+            'pick_us': time_each(board.pick, points),
+            'pick_linear_us': time_each(linear_pick, points),
+            'raise_us': time_each(board.raise_piece, pieces),
+            'drag_step_us': time_each(board.move, nudges),
+            'drag_jump_us': time_each(board.move, moves),
+            'snap_us': time_each(board.drop, pieces),
+            'redraw_query_us': time_each(board.pieces_in, dirty),
+            'draw_us': time_each(lambda piece: board.draw_piece(canvas, piece), pieces),
+        }
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = ('pick_us', 'pick_linear_us', 'raise_us', 'drag_step_us', 'drag_jump_us', 'snap_us',
+               'redraw_query_us', 'draw_us', 'extra_kb')
+    print(f"原图 {image_kb:.0f} KB；每块复制一份像素的旧做法额外占用同样大小")
+    print(f"{'网格':<15}{'块数':>6}" + "".join(f"{name:>17}" for name in columns))
+    for name, row in results.items():
+        print(f"{name:<15}{row['pieces']:>6}" + "".join(f"{row[column]:>17.2f}" for column in columns))
+
+
+def click(pos=(400, 300)):
+    return [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=pos)]
+
+
+def drag(start, end, steps=8):
+    """一次完整的拖拽：按下、分 steps 帧移动、松开，每帧一组事件"""
+    yield [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=start)]
+    for i in range(1, steps + 1):
+        pos = (start[0] + (end[0] - start[0]) * i // steps,
+               start[1] + (end[1] - start[1]) * i // steps)
+        yield [pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(1, 0, 0))]
+    yield [pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=end)]
+
+
+def solve_puzzle(scene):
+    """按置换环把每块拖到目标位置：先把环上的一块挪到拼图区域外的空处，
+    空出的格子依次由应该在那里的块填上，最后把挪开的那块放回去；拖放时不会有块被压住"""
+    board = scene.board
+    spare = (board.piece_w // 2 + 10, 590 - board.piece_h // 2)
+    
+    def move(piece, center):
+        yield from drag(piece.rect.center, center)
+        # 两次点击之间要超过场景的点击间隔
+        for _ in range(15):
+            yield []
+    
+    def target_center(piece):
+        return pygame.Rect(piece.target, piece.rect.size).center
+    
+    for start in board.pieces:
+        if start.correct:
+            continue
+        free_slot = board.slot_at(start.rect.center)
+        yield from move(start, spare)
+        while True:
+            piece = board.pieces[free_slot]
+            if piece is start:
+                yield from move(start, target_center(start))
+                break
+            free_slot = board.slot_at(piece.rect.center)
+            yield from move(piece, target_center(piece))
+
+
+def flow_events(game, video_seconds):
+    """按当前场景生成每一帧的合成输入，走完 标题 → 问答/介绍 → 拼图 → 视频 → 致谢 的流程"""
+    scene, frames = None, 0
+    puzzle = None
+    while True:
+        if game.current_scene is not scene:
+            scene, frames = game.current_scene, 0
+            entered = time.perf_counter()
+        frames += 1
+        name = type(scene).__name__
+        
+        if name == 'ThankScene':
+            # 致谢场景点击会退出程序，看完淡入就结束
+            if frames > 120 and not scene.is_animating():
+                return
+            yield []
+        elif name == 'PuzzleScene':
+            if puzzle is None:
+                puzzle = solve_puzzle(scene)
+            events = next(puzzle, None)
+            if events is not None:
+                yield events
+            else:
+                # 拼完后等提示淡入，然后点击继续
+                yield click() if frames % 20 == 0 else []
+        elif name == 'VideoScene':
+            play_frames = int(video_seconds * game.fps)
+            if frames == play_frames // 2:
+                # 中途在进度条上点一次，测跳转
+                progress = scene.progress_rect
+                yield click((progress.left + progress.width // 4, progress.centery))
+            elif frames > play_frames and frames % 20 == 0:
+                yield click((715, 555))
+            else:
+                yield []
+        elif name == 'QuizScene' and not scene.show_result:
+            # 第一个选项
+            yield click((400, 270)) if frames > 60 and frames % 20 == 0 else []
+        else:
+            # 标题、问答结果和各介绍页：入场动画后点击继续
+            yield click() if frames > 60 and frames % 20 == 0 else []
+        if time.perf_counter() - entered > 60:
+            raise RuntimeError(f"基准流程卡在 {name}")
+
+
+def bench_flow(args):
+    """无界面跑完整个场景流程，输出各场景帧耗时百分位、切换耗时、峰值内存和分配"""
+    # 场景里的调试输出转到 stderr，stdout 只留 JSON 结果
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run_flow(args)
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+
+def run_flow(args):
+    random.seed(0)
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    game = make_game(asset_budget_mb=args.asset_budget_mb)
+    game.running = True
+    game.show_first_frame()
+    
+    frame_times = {}
+    phase_totals = {}
+    allocations = {}
+    current, blocks, collections = None, 0, 0
+    def gc_count():
+        return sum(stat['collections'] for stat in gc.get_stats())
+    
+    for events in flow_events(game, args.video_seconds):
+        ms = game.step(events)
+        name = game.current_scene.node.id
+        if name != current:
+            # 进入新场景，把上一个场景期间的分配记到它名下
+            if current is not None:
+                row = allocations.setdefault(current, {'alloc_blocks': 0, 'gc_collections': 0})
+                row['alloc_blocks'] += sys.getallocatedblocks() - blocks
+                row['gc_collections'] += gc_count() - collections
+            current, blocks, collections = name, sys.getallocatedblocks(), gc_count()
+            if args.tracemalloc:
+                tracemalloc.reset_peak()
+        frame_times.setdefault(name, []).append(ms)
+        totals = phase_totals.setdefault(name, dict.fromkeys(demo1.FrameProfiler.PHASES, 0.0))
+        for phase, phase_ms in game.profiler.history[-1][2].items():
+            totals[phase] += phase_ms
+        if args.tracemalloc:
+            row = allocations.setdefault(name, {'alloc_blocks': 0, 'gc_collections': 0})
+            row['traced_peak_mb'] = max(row.get('traced_peak_mb', 0), tracemalloc.get_traced_memory()[1] / 2**20)
+        # 按正常帧率推进，视频解码、淡入等按真实时间运行的部分才和实际一致
+        game.clock.tick(game.fps)
+    row = allocations.setdefault(current, {'alloc_blocks': 0, 'gc_collections': 0})
+    row['alloc_blocks'] += sys.getallocatedblocks() - blocks
+    row['gc_collections'] += gc_count() - collections
+    
+    scenes = {}
+    for name, times in frame_times.items():
+        ordered = sorted(times)
+        scenes[name] = {
+            'frames': len(times),
+            'mean_ms': statistics.fmean(times),
+            'p50_ms': percentile(ordered, 50),
+            'p90_ms': percentile(ordered, 90),
+            'p99_ms': percentile(ordered, 99),
+            'max_ms': ordered[-1],
+            'over_budget_frames': sum(t > game.frame_budget_ms for t in times),
+            'phases_mean_ms': {phase: total / len(times) for phase, total in phase_totals[name].items()},
+            **allocations.get(name, {}),
+        }
+    result = {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'total_s': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb(),
+        'scenes': scenes,
+        'transitions': [{'from': a, 'to': b, 'ms': ms} for a, b, ms in game.transition_latencies],
+        'asset_cache': game.assets.stats(),
+        'input': game.input.stats(),
+    }
+    close_game(game)
+    return result
+
+
+def bench_input(args):
+    """触摸屏拖动拼图时每帧收到大量移动事件：合并移动事件前后每帧的事件处理和总耗时"""
+    with contextlib.redirect_stdout(sys.stderr):
+        results = {('coalesced' if coalesce else 'raw'): run_input(args, coalesce) for coalesce in (False, True)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"每帧 {args.events_per_frame} 个移动事件，{args.frames} 帧")
+    print(f"{'方式':<12}{'事件阶段 ms':>14}{'帧 p50 ms':>12}{'帧 p95 ms':>12}{'送达事件':>10}{'输入延迟 p95 ms':>18}")
+    for mode, row in results.items():
+        print(f"{mode:<12}{row['events_mean_ms']:>14.3f}{row['frame_p50_ms']:>12.3f}{row['frame_p95_ms']:>12.3f}"
+              f"{row['input']['delivered']:>10}{row['input']['latency_p95_ms']:>18.3f}")
+
+
+def run_input(args, coalesce):
+    random.seed(0)
+    game = make_game(coalesce_motion=coalesce)
+    game.running = True
+    game.show_first_frame()
+    puzzle = next(node.id for node in game.graph.nodes.values() if node.scene_class is demo1.PuzzleScene)
+    game.current_scene.next_scene = game.scene(puzzle)
+    game.step([])
+    scene = game.current_scene
+    
+    # 按住一块拼图在屏幕上来回拖，每帧收到 events_per_frame 个移动事件
+    piece = scene.board.pieces[0]
+    start = piece.rect.center
+    game.step(click(start))
+    frame_times, event_times = [], []
+    for frame in range(args.frames):
+        events = []
+        for i in range(args.events_per_frame):
+            t = (frame * args.events_per_frame + i) / (args.frames * args.events_per_frame)
+            pos = (int(start[0] - 300 * math.sin(t * math.pi * 4)), start[1] + int(100 * math.sin(t * math.pi * 6)))
+            events.append(pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(1, 1), buttons=(1, 0, 0)))
+        frame_times.append(game.step(events))
+        event_times.append(game.profiler.history[-1][2]['events'])
+        game.clock.tick(args.fps)
+    game.step([pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=piece.rect.center)])
+    
+    ordered = sorted(frame_times)
+    result = {
+        'events_mean_ms': statistics.fmean(event_times),
+        'frame_p50_ms': percentile(ordered, 50),
+        'frame_p95_ms': percentile(ordered, 95),
+        'input': game.input.stats(),
+    }
+    close_game(game)
+    return result
+
+
+def bench_soak(args):
+    """展台模式连续跑多个游客会话，检查常驻内存不随会话数增长；增长超过阈值时返回非零退出码"""
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run_soak(args)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if not result['passed']:
+        sys.exit(1)
+
+
+def run_soak(args):
+    random.seed(0)
+    game = make_game(kiosk=True, asset_budget_mb=args.asset_budget_mb)
+    if not args.fps:
+        game.time_source = frame_clock(game)
+    game.running = True
+    game.show_first_frame()
+    start = time.perf_counter()
+    
+    samples = []
+    for session in range(args.sessions):
+        for events in flow_events(game, args.video_seconds):
+            game.step(events)
+            game.clock.tick(args.fps)
+        # 点击致谢页，展台模式下回到首页
+        game.step(click())
+        while game.current_scene.node.id != game.graph.start:
+            game.step([])
+            game.clock.tick(args.fps)
+        samples.append((rss_mb(), sys.getallocatedblocks(), game.assets.evictions))
+        if session % 10 == 0:
+            print(f"会话 {session + 1}/{args.sessions}: RSS {samples[-1][0]:.1f} MB, "
+                  f"淘汰 {game.assets.evictions} 次", file=sys.__stderr__)
+    
+    # 图片缓存装满之前常驻内存随缓存一起增长，预热到缓存开始淘汰、常驻内存稳定之后才开始比较；
+    # 比较开头和结尾各一段的中位数，不受单次波动影响
+    saturated = next((i + 1 for i, (_, _, evictions) in enumerate(samples) if evictions), None)
+    warmup = soak_warmup(samples, saturated, args.warmup, args.max_growth_mb / 4)
+    result = {
+        'sessions': args.sessions,
+        'total_s': time.perf_counter() - start,
+        'cache_saturated_session': saturated,
+        'warmup_sessions': warmup,
+        'max_growth_mb': args.max_growth_mb,
+        'peak_rss_mb': peak_rss_mb(),
+        'asset_cache': game.assets.stats(),
+        'scene_pool': sorted(game.scenes),
+        'passed': False,
+    }
+    if warmup is None:
+        print("图片缓存没有装满或常驻内存没有稳定下来，会话数不够，无法判断是否增长", file=sys.__stderr__)
+    else:
+        steady = samples[warmup:]
+        window = max(1, len(steady) // 10)
+        first_rss = statistics.median(rss for rss, _, _ in steady[:window])
+        last_rss = statistics.median(rss for rss, _, _ in steady[-window:])
+        first_blocks = statistics.median(blocks for _, blocks, _ in steady[:window])
+        last_blocks = statistics.median(blocks for _, blocks, _ in steady[-window:])
+        result.update({
+            'rss_after_warmup_mb': first_rss,
+            'rss_end_mb': last_rss,
+            'rss_growth_mb': last_rss - first_rss,
+            'alloc_blocks_growth': last_blocks - first_blocks,
+            'passed': last_rss - first_rss <= args.max_growth_mb,
+        })
+    close_game(game)
+    return result
+
+
+def soak_warmup(samples, saturated, window, tolerance_mb):
+    """预热的会话数：缓存装满之后至少再跑 window 个会话，并且前后相邻两段（各 window 个会话）
+    常驻内存中位数的差不超过 tolerance_mb；缓存没装满、稳定之后剩下的会话不足以比较时返回 None"""
+    if saturated is None:
+        return None
+    rss = [sample[0] for sample in samples]
+    for end in range(max(saturated + window, 2 * window), len(samples) - window + 1):
+        before = statistics.median(rss[end - 2 * window:end - window])
+        after = statistics.median(rss[end - window:end])
+        if after - before <= tolerance_mb:
+            return end
+    return None
+
+
+def bench_tween(args):
+    """同一段入场动画在不同帧率下用模拟时钟跑完：动画时长应当和帧率无关，帧率只影响帧数"""
+    with contextlib.redirect_stdout(sys.stderr):
+        results = {fps: run_tween(fps, args.blink_seconds) for fps in args.fps}
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    names = list(results[args.fps[0]])
+    print(f"{'场景':<16}" + "".join(f"{f'{fps} FPS':>18}" for fps in args.fps))
+    for name in names:
+        cells = []
+        for fps in args.fps:
+            row = results[fps][name]
+            if 'toggles' in row:
+                cells.append(f"{row['toggles']} 次闪烁")
+            else:
+                cells.append(f"{row['seconds']:.2f} s / {row['frames']} 帧")
+        print(f"{name:<16}" + "".join(f"{cell:>18}" for cell in cells))
+
+
+def run_tween(fps, blink_seconds):
+    random.seed(0)
+    game = make_game()
+    now = [0.0]
+    game.time_source = lambda: now[0]
+    game.running = True
+    game.show_first_frame()
+    
+    def frame():
+        now[0] += 1 / fps
+        game.step([])
+    
+    row = {}
+    # 标题页闪烁：固定时长内切换显示的次数
+    scene, toggles = game.current_scene, 0
+    shown = scene.show_subtitle
+    for _ in range(int(blink_seconds * fps)):
+        frame()
+        toggles += scene.show_subtitle != shown
+        shown = scene.show_subtitle
+    row[scene.node.id] = {'toggles': toggles}
+    
+    # 每种有入场动画的场景取第一个节点，测从进入到动画结束的动画时间和帧数
+    measured = set()
+    for node in game.graph.nodes.values():
+        if node.scene_class not in (demo1.IntroductionScene, demo1.QuizScene, demo1.ThankScene) \
+                or node.scene_class in measured:
+            continue
+        measured.add(node.scene_class)
+        game.current_scene.next_scene = game.scene(node.id)
+        game.step([])
+        scene, start, frames = game.current_scene, now[0], 0
+        while scene.timeline.busy:
+            frame()
+            frames += 1
+        row[node.id] = {'seconds': now[0] - start, 'frames': frames}
+    close_game(game)
+    return row
+
+
+# 会分配新 Surface 的 pygame 函数和方法
+SURFACE_ALLOCATORS = frozenset(('copy', 'convert', 'convert_alpha', 'subsurface', 'render',
+                                'scale', 'smoothscale', 'rotate', 'rotozoom', 'flip', 'frombuffer'))
+
+
+@contextlib.contextmanager
+def count_surface_allocations():
+    """统计期间调用了多少次会分配 Surface 的 pygame 函数，产出一个单元素列表作为计数器"""
+    counter = [0]
+    def profile(frame, event, arg):
+        if event == 'c_call' and arg.__name__ in SURFACE_ALLOCATORS:
+            owner = getattr(arg, '__self__', None)
+            if isinstance(owner, (pygame.Surface, pygame.font.Font)) or owner in (pygame.transform, pygame.image):
+                counter[0] += 1
+    sys.setprofile(profile)
+    try:
+        yield counter
+    finally:
+        sys.setprofile(None)
+
+
+def bench_fade(args):
+    """淡入动画期间每帧 draw() 的 Surface 分配次数、Python 堆临时分配和绘制耗时"""
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_fade(args)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    print(f"{'场景':<24}{'动画帧':>8}{'Surface 分配/帧':>18}{'堆临时分配 KB/帧':>20}{'绘制 us/帧':>14}")
+    for name, row in results.items():
+        print(f"{name:<24}{row['frames']:>8}{row['surface_allocs_per_frame']:>18.2f}"
+              f"{row['heap_peak_kb_per_frame']:>20.2f}{row['draw_us']:>14.1f}")
+
+
+def run_fade(args):
+    random.seed(0)
+    game = make_game()
+    results = {}
+    measured = set()
+    for node in game.graph.nodes.values():
+        if node.scene_class not in (demo1.IntroductionScene, demo1.QuizScene, demo1.ThankScene) \
+                or node.scene_class in measured:
+            continue
+        measured.add(node.scene_class)
+        scene = game.scene(node.id)
+        
+        def animation_frames():
+            """从进入场景开始按 args.fps 推进动画，产出每一个动画帧"""
+            scene.enter()
+            # 第一轮绘制填充文字缓存，之后测的是稳定状态
+            scene.draw()
+            frame = 0
+            while True:
+                scene.timeline.update(frame / args.fps)
+                scene.update()
+                if not scene.timeline.busy and frame:
+                    break
+                yield
+                frame += 1
+        
+        frames, allocs, peaks = 0, 0, []
+        tracemalloc.start()
+        for _ in animation_frames():
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            with count_surface_allocations() as counter:
+                scene.draw()
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            allocs += counter[0]
+            frames += 1
+        tracemalloc.stop()
+        
+        # 计时单独跑一遍，不受统计钩子影响
+        draw_times = []
+        for _ in animation_frames():
+            start = time.perf_counter()
+            scene.draw()
+            draw_times.append((time.perf_counter() - start) * 1e6)
+        scene.exit()
+        results[node.id] = {
+            'frames': frames,
+            'surface_allocs_per_frame': allocs / frames,
+            'heap_peak_kb_per_frame': statistics.fmean(peaks) / 1024,
+            'draw_us': statistics.fmean(draw_times),
+        }
+    close_game(game)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="数字江南·智慧苏州 性能基准")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    blit = subparsers.add_parser("blit", help="各场景绘制开销，对比像素格式转换前后")
+    blit.add_argument("--frames", type=int, default=200)
+    blit.add_argument("--json", action="store_true")
+    blit.set_defaults(func=bench_blit)
+
+    upload = subparsers.add_parser("video-upload", help="视频帧上传的耗时与内存分配")
+    upload.add_argument("--frames", type=int, default=120)
+    upload.add_argument("--json", action="store_true")
+    upload.set_defaults(func=bench_video_upload)
+
+    audio = subparsers.add_parser("audio", help="背景音乐启动耗时与内存")
+    audio.add_argument("--runs", type=int, default=3)
+    audio.add_argument("--json", action="store_true")
+    audio.add_argument("--worker", choices=["sound", "music"], help=argparse.SUPPRESS)
+    audio.set_defaults(func=bench_audio)
+
+    bundle = subparsers.add_parser("bundle", help="预缩放图片包 vs 直接解码原图的启动耗时和内存")
+    bundle.add_argument("--runs", type=int, default=5)
+    bundle.add_argument("--json", action="store_true")
+    bundle.add_argument("--worker", help=argparse.SUPPRESS)
+    bundle.set_defaults(func=bench_bundle)
+
+    decode = subparsers.add_parser("decode", help="并行解码图片时线程数从 1 到 N 的扩展性")
+    decode.add_argument("--max-workers", type=int, help="默认为 CPU 核数")
+    decode.add_argument("--runs", type=int, default=3)
+    decode.add_argument("--json", action="store_true")
+    decode.set_defaults(func=bench_decode)
+
+    puzzle = subparsers.add_parser("puzzle", help="拼图引擎在不同块数下的拾取、拖动、吸附耗时 (微秒)")
+    puzzle.add_argument("--grids", type=int, nargs="+", default=[3, 10, 20], help="每边块数")
+    puzzle.add_argument("--shapes", nargs="+", choices=demo1.PuzzleBoard.SHAPES, default=list(demo1.PuzzleBoard.SHAPES))
+    puzzle.add_argument("--size", type=int, default=400, help="拼图区域边长 (像素)")
+    puzzle.add_argument("--ops", type=int, default=2000)
+    puzzle.add_argument("--json", action="store_true")
+    puzzle.set_defaults(func=bench_puzzle)
+
+    inputs = subparsers.add_parser("input", help="拖动拼图时大量移动事件合并前后的事件处理耗时")
+    inputs.add_argument("--events-per-frame", type=int, default=40)
+    inputs.add_argument("--frames", type=int, default=300)
+    inputs.add_argument("--fps", type=int, default=60)
+    inputs.add_argument("--json", action="store_true")
+    inputs.set_defaults(func=bench_input)
+
+    flow = subparsers.add_parser("flow", help="跑完整个场景流程，输出帧耗时、切换耗时和内存 (JSON)")
+    flow.add_argument("--video-seconds", type=float, default=4.0)
+    flow.add_argument("--tracemalloc", action="store_true",
+                      help="额外记录各场景 Python 堆分配峰值（会拖慢帧耗时）")
+    flow.add_argument("--output", help="JSON 结果同时写入该文件")
+    flow.add_argument("--asset-budget-mb", type=float, default=64, help="图片缓存的像素内存预算")
+    flow.set_defaults(func=bench_flow)
+
+    soak = subparsers.add_parser("soak", help="展台模式连续跑多个会话，检查内存是否增长")
+    soak.add_argument("--sessions", type=int, default=1000)
+    soak.add_argument("--warmup", type=int, default=10,
+                      help="图片缓存装满后至少再跑的预热会话数，也是判断常驻内存是否稳定的窗口")
+    soak.add_argument("--max-growth-mb", type=float, default=8.0)
+    soak.add_argument("--video-seconds", type=float, default=0.5)
+    soak.add_argument("--fps", type=int, default=0, help="限制帧率，0 表示不限制")
+    soak.add_argument("--asset-budget-mb", type=float, default=64, help="图片缓存的像素内存预算")
+    soak.set_defaults(func=bench_soak)
+
+    tween = subparsers.add_parser("tween", help="不同帧率下入场动画的时长和帧数（模拟时钟）")
+    tween.add_argument("--fps", type=int, nargs="+", default=[10, 30, 60, 144])
+    tween.add_argument("--blink-seconds", type=float, default=3.0, help="统计标题页闪烁次数的时长")
+    tween.add_argument("--json", action="store_true")
+    tween.set_defaults(func=bench_tween)
+
+    fade = subparsers.add_parser("fade", help="淡入动画期间每帧的 Surface 分配次数和绘制耗时")
+    fade.add_argument("--fps", type=int, default=60)
+    fade.add_argument("--json", action="store_true")
+    fade.set_defaults(func=bench_fade)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
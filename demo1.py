@@ -1,3 +1,6 @@
+import time
+# 启动报告的起点，在导入 pygame 之前记下
+_IMPORT_START = time.perf_counter()
 import pygame
 import sys
 import os
@@ -5,12 +8,1514 @@ import platform
 import random
 import math
 import gc  # 添加这行
-from moviepy.editor import VideoFileClip
+import re
+import glob
+import bisect
+import hashlib
+import subprocess
+import queue
+import threading
+import importlib
+import atexit
+import csv
+import json
+import mmap
+import struct
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import pygame.display
 
+# 带透明通道图片在显示格式下的表示方式
+TRANSPARENCY_MODES = ('alpha', 'colorkey', 'opaque')
+# colorkey 模式下用来表示透明像素的颜色
+COLORKEY = (255, 0, 255)
+# 场景流程和内容的数据文件
+SCENE_FILE = "assets/scenes.json"
+# 安装时生成的预缩放图片包（demo1.py --build-assets）
+BUNDLE_FILE = "assets/images.bundle"
+# 问答和介绍场景的随机背景图
+BACKGROUND_DIR = "assets/image"
+# 并行解码图片的线程数；SDL_image 解码和缩放时释放 GIL，多个线程能用上多个核
+DECODE_WORKERS = min(4, os.cpu_count() or 1)
+# 算作游客操作的事件，展台模式据此判断无人操作超时
+INPUT_EVENTS = (pygame.MOUSEBUTTONDOWN, pygame.MOUSEMOTION, pygame.KEYDOWN)
+
+
+class StartupReport:
+    """启动耗时报告：记录从导入模块到第一帧显示的各个阶段，以及之后按需导入的重型模块"""
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.phases = []        # (阶段, 开始, 结束)，时间相对 self.start
+        self.first_frame = None
+        self.verbose = False
+    
+    def mark(self, phase):
+        """记录从上一个阶段结束到现在的一段"""
+        now = time.perf_counter()
+        self.record(phase, self.last, now)
+        self.last = now
+    
+    def record(self, phase, start, end=None):
+        end = time.perf_counter() if end is None else end
+        self.phases.append((phase, start - self.start, end - self.start))
+        # 第一帧之后发生的（按需导入、延迟初始化）立即打印
+        if self.verbose and self.first_frame is not None:
+            self.print_phase(self.phases[-1])
+    
+    def frame_shown(self):
+        if self.first_frame is not None:
+            return
+        self.mark("第一帧")
+        self.first_frame = self.last - self.start
+        if self.verbose:
+            self.print_report()
+    
+    @staticmethod
+    def print_phase(phase):
+        name, start, end = phase
+        print(f"{start * 1000:>9.1f}{(end - start) * 1000:>9.1f}  {name}")
+    
+    def print_report(self):
+        print(f"启动报告：第一帧 {self.first_frame * 1000:.1f} ms")
+        print(f"{'开始 ms':>9}{'耗时 ms':>9}  阶段")
+        for phase in self.phases:
+            self.print_phase(phase)
+
+
+STARTUP = StartupReport(_IMPORT_START)
+STARTUP.mark("导入模块")
+
+
+def lazy_import(name):
+    """按需导入重型模块（moviepy 会连带导入 numpy、imageio 等），首次导入的耗时记入启动报告"""
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        STARTUP.record(f"导入 {name}", start)
+    return module
+
+
+def ffmpeg_binary():
+    return lazy_import("moviepy.config").get_setting("FFMPEG_BINARY")
+
+
+def open_video_clip(path):
+    """打开视频读取元数据，moviepy 只在真正用到视频时才导入"""
+    return lazy_import("moviepy.video.io.VideoFileClip").VideoFileClip(path, audio=False)
+
+class AssetCache:
+    """进程级图片缓存：按 (路径, 尺寸, 转换模式) 保存解码并缩放后的 Surface，
+    超出内存预算时按最近最少使用 (LRU) 顺序淘汰
+    
+    载入的图片默认转换为显示设备的像素格式，避免每帧 blit 时再做格式转换；
+    不透明图片用 convert()，带透明通道的图片按 transparency 选择
+    逐像素 alpha、colorkey 或直接丢弃透明度
+    """
+    def __init__(self, budget_bytes=64 * 1024 * 1024, transparency='alpha', convert_images=True):
+        if transparency not in TRANSPARENCY_MODES:
+            raise ValueError(f"未知的透明模式: {transparency}")
+        self.budget_bytes = budget_bytes
+        self.transparency = transparency
+        # 关闭后保留解码时的原始像素格式，仅用于基准对比
+        self.convert_images = convert_images
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # 后台预取器和预缩放图片包，由 Game 在创建后挂上
+        self.preloader = None
+        self.bundle = None
+
+    @staticmethod
+    def surface_bytes(surface):
+        return surface.get_pitch() * surface.get_height()
+
+    @staticmethod
+    def make_key(path, size=None, mode=None):
+        return (os.path.normpath(path), tuple(size) if size else None, mode)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get_image(self, path, size=None, mode=None):
+        """返回缓存的图片，未命中时解码、缩放并放入缓存
+        
+        缓存中的 Surface 由所有场景共享，调用方不得修改它（需要改动时先 copy()）
+        """
+        key = self.make_key(path, size, mode)
+        surface = self._entries.get(key)
+        if surface is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return surface
+        
+        self.misses += 1
+        # 图片包里有预缩放好的像素时直接用；否则预取线程已经（或正在）解码这张图时取它的结果，避免重复解码
+        raw = self.bundle.get_raw(path, size) if self.bundle else None
+        if raw is None and self.preloader:
+            raw = self.preloader.take(key)
+        if raw is not None:
+            surface = self.surface_from_raw(raw, mode)
+        else:
+            surface = self.load_image(path, size, mode)
+        self.store(key, surface)
+        return surface
+
+    @staticmethod
+    def decode_raw(path, size=None):
+        """解码并缩放图片，返回 (像素数据, 尺寸, 格式)，不依赖显示设备，可在工作线程中调用"""
+        image = pygame.image.load(path)
+        if size:
+            image = pygame.transform.scale(image, size)
+        fmt = 'RGBA' if image.get_flags() & pygame.SRCALPHA else 'RGB'
+        return pygame.image.tobytes(image, fmt), image.get_size(), fmt
+
+    @classmethod
+    def decode_batch(cls, requests, workers=DECODE_WORKERS):
+        """用线程池并行解码、缩放一批图片，requests 为 (路径, 尺寸) 列表，按原顺序返回原始像素数据"""
+        if workers <= 1 or len(requests) <= 1:
+            return [cls.decode_raw(path, size) for path, size in requests]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ImageDecode") as pool:
+            return list(pool.map(lambda request: cls.decode_raw(*request), requests))
+
+    def surface_from_raw(self, raw, mode=None):
+        # frombuffer 不复制像素，转换为显示格式时才复制一次
+        data, size, fmt = raw
+        return self.finish_image(pygame.image.frombuffer(data, size, fmt), mode)
+
+    def load_image(self, path, size=None, mode=None):
+        image = pygame.image.load(path)
+        if size:
+            image = pygame.transform.scale(image, size)
+        return self.finish_image(image, mode)
+
+    def finish_image(self, image, mode=None):
+        """把图片转换为显示格式，mode 为 None 时根据图片是否带透明通道自动选择"""
+        if not self.convert_images:
+            return image
+        if mode is None:
+            mode = self.transparency if image.get_flags() & pygame.SRCALPHA else 'opaque'
+        if mode == 'alpha':
+            return image.convert_alpha()
+        if mode == 'colorkey':
+            return self.to_colorkey(image)
+        return image.convert()
+
+    @staticmethod
+    def to_colorkey(image, threshold=128):
+        """把逐像素 alpha 压成二值透明：alpha 低于阈值的像素填成 COLORKEY"""
+        surface = image.convert()
+        if image.get_flags() & pygame.SRCALPHA:
+            mask = pygame.mask.from_surface(image, threshold)
+            mask.invert()
+            mask.to_surface(surface, setcolor=COLORKEY, unsetcolor=None)
+        surface.set_colorkey(COLORKEY, pygame.RLEACCEL)
+        return surface
+
+    def get_cached(self, key):
+        """按键取出已缓存的 Surface（如合成好的静态图层），没有时返回 None"""
+        surface = self._entries.get(key)
+        if surface is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return surface
+
+    def store(self, key, surface):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.used_bytes -= self.surface_bytes(old)
+        self._entries[key] = surface
+        self.used_bytes += self.surface_bytes(surface)
+        
+        # 超出预算时淘汰最久未使用的图片，至少保留刚放入的这一张
+        while self.used_bytes > self.budget_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.used_bytes -= self.surface_bytes(evicted)
+            self.evictions += 1
+        self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+
+    @staticmethod
+    def list_images(directory, exclude=('guide.png',)):
+        """按文件名顺序列出目录中的图片路径"""
+        return [
+            os.path.join(directory, file)
+            for file in sorted(os.listdir(directory))
+            if file.endswith(('.jpg', '.jpeg', '.png')) and file not in exclude
+        ]
+
+    def clear(self):
+        self._entries.clear()
+        self.used_bytes = 0
+
+    def residency(self):
+        """当前驻留的图片，按最久未使用到最近使用排列：(缓存键, 宽, 高, 字节数, 是否被场景持有)
+        
+        被场景持有的 Surface 即使被淘汰也不会释放，预算只能约束其余部分
+        """
+        return [
+            (key, *self._entries[key].get_size(), self.surface_bytes(self._entries[key]), self.is_pinned(key))
+            for key in self._entries
+        ]
+
+    def is_pinned(self, key):
+        # 引用只有缓存字典和 getrefcount 的参数两处时没有别人持有
+        return sys.getrefcount(self._entries[key]) > 2
+
+    def pinned_bytes(self):
+        return sum(self.surface_bytes(self._entries[key]) for key in self._entries if self.is_pinned(key))
+
+    def print_residency(self):
+        stats = self.stats()
+        print(f"图片缓存: {stats['entries']} 张, {stats['used_bytes'] / 2**20:.1f} / "
+              f"{stats['budget_bytes'] / 2**20:.0f} MB, 峰值 {stats['peak_bytes'] / 2**20:.1f} MB, "
+              f"被持有 {stats['pinned_bytes'] / 2**20:.1f} MB, 淘汰 {stats['evictions']} 次")
+        for key, width, height, size, pinned in self.residency():
+            print(f"  {size / 2**20:6.2f} MB  {width}x{height}  {'*' if pinned else ' '} {key}")
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'used_bytes': self.used_bytes,
+            'peak_bytes': self.peak_bytes,
+            'pinned_bytes': self.pinned_bytes(),
+            'budget_bytes': self.budget_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+class TextCache:
+    """文字渲染缓存：按 (字体, 文字, 颜色, 抗锯齿) 缓存 font.render 的结果，按 LRU 淘汰
+    
+    同一段文字的不同透明度共用一个 Surface，取用时设置 Surface 级 alpha，不重新渲染；
+    因此返回的 Surface 只应立即 blit，不要长期持有或修改
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.render_ms = 0.0
+        # 当前帧的统计，end_frame() 时归档到 last_frame
+        self._frame_hits = 0
+        self._frame_misses = 0
+        self._frame_render_ms = 0.0
+        self.last_frame = (0, 0, 0.0)
+        self.max_frame_render_ms = 0.0
+
+    def render(self, font, text, color, antialias=True, alpha=255):
+        key = (font, text, tuple(color), antialias)
+        surface = self._entries.get(key)
+        if surface is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._frame_hits += 1
+        else:
+            start = time.perf_counter()
+            surface = font.render(text, antialias, color)
+            elapsed = (time.perf_counter() - start) * 1000
+            self.misses += 1
+            self._frame_misses += 1
+            self.render_ms += elapsed
+            self._frame_render_ms += elapsed
+            self._entries[key] = surface
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        
+        if surface.get_alpha() != alpha:
+            surface.set_alpha(alpha)
+        return surface
+
+    def end_frame(self):
+        self.last_frame = (self._frame_hits, self._frame_misses, self._frame_render_ms)
+        self.max_frame_render_ms = max(self.max_frame_render_ms, self._frame_render_ms)
+        self._frame_hits = 0
+        self._frame_misses = 0
+        self._frame_render_ms = 0.0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'render_ms': self.render_ms,
+            'last_frame_render_ms': self.last_frame[2],
+            'max_frame_render_ms': self.max_frame_render_ms,
+        }
+
+
+class AlphaView:
+    """共享图片的透明度视图：覆盖整张图的 subsurface 和原图共用像素，
+    但有自己的 Surface 级 alpha，淡入淡出时不复制图片，也不改动缓存里其他场景在用的原图
+    
+    colorkey 和逐像素 alpha 都保留，Surface 级 alpha 与逐像素 alpha 相乘
+    """
+    def __init__(self, surface):
+        self.view = surface.subsurface(surface.get_rect())
+        self.alpha = 255
+        self.view.set_alpha(255)
+
+    def blit(self, target, pos, alpha=255):
+        alpha = max(0, min(255, int(alpha)))
+        if alpha == 0:
+            return
+        if alpha != self.alpha:
+            self.alpha = alpha
+            self.view.set_alpha(alpha)
+        target.blit(self.view, pos)
+
+
+class AssetPreloader:
+    """后台预取线程：提前把下一个场景要用的图片解码成原始像素数据、提前打开视频，
+    主线程在场景切换时只需做很便宜的 Surface 创建；workers 个线程同时解码"""
+    def __init__(self, assets, workers=DECODE_WORKERS):
+        self.assets = assets
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._ready = {}        # 缓存键 -> 原始像素数据
+        self._pending = {}      # 缓存键 -> 解码完成事件
+        self._videos = {}       # 视频路径 -> 已打开的 VideoFileClip
+        self._video_pending = {}
+        # 已经被工作线程取走、正在处理的任务（完成事件），只有这些任务值得主线程等待
+        self._started = set()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"AssetPreloader-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def prefetch(self, requests):
+        """提交预取请求，requests 为 (类型, 路径, 尺寸, 模式) 列表，类型为 'image' 或 'video'"""
+        for kind, path, size, mode in requests:
+            if kind == 'video':
+                with self._lock:
+                    if path in self._videos or path in self._video_pending:
+                        continue
+                    done = self._video_pending[path] = threading.Event()
+                self._queue.put(('video', path, None, done))
+                continue
+            
+            key = self.assets.make_key(path, size, mode)
+            if key in self.assets:
+                continue
+            # 图片包里有的图片载入很便宜，不必占用预取线程
+            if self.assets.bundle and AssetBundle.make_key(path, size) in self.assets.bundle:
+                continue
+            with self._lock:
+                if key in self._ready or key in self._pending:
+                    continue
+                done = self._pending[key] = threading.Event()
+            self._queue.put(('image', path, key, done))
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            kind, path, key, done = job
+            pending = self._video_pending if kind == 'video' else self._pending
+            with self._lock:
+                # 主线程等不及、已经自己加载了的任务直接丢弃
+                if pending.get(path if kind == 'video' else key) is not done:
+                    continue
+                self._started.add(done)
+            try:
+                if kind == 'video':
+                    clip = open_video_clip(path)
+                    with self._lock:
+                        self._videos[path] = clip
+                else:
+                    raw = AssetCache.decode_raw(path, key[1])
+                    with self._lock:
+                        self._ready[key] = raw
+            except Exception as e:
+                print(f"预取失败 {path}: {e}")
+            finally:
+                with self._lock:
+                    pending.pop(path if kind == 'video' else key, None)
+                    self._started.discard(done)
+                done.set()
+
+    def _take(self, results, pending, key):
+        """取出预取结果：工作线程正在处理时等它完成；还排在队列里时撤销任务，
+        返回 None 由调用方同步加载，不必等排在前面的其他任务；未提交过也返回 None"""
+        with self._lock:
+            result = results.pop(key, None)
+            done = pending.get(key)
+            if result is None and done is not None and done not in self._started:
+                del pending[key]
+                done = None
+        if result is None and done is not None:
+            done.wait()
+            with self._lock:
+                result = results.pop(key, None)
+        return result
+
+    def take(self, key):
+        """取出预取好的原始像素数据，规则见 _take()"""
+        return self._take(self._ready, self._pending, key)
+
+    def take_video(self, path):
+        """取出预先打开的视频，规则见 _take()"""
+        return self._take(self._videos, self._video_pending, path)
+
+    def collect(self):
+        """在主线程中把已解码的数据转成 Surface 放入缓存，每帧调用一次"""
+        with self._lock:
+            ready, self._ready = self._ready, {}
+        for key, raw in ready.items():
+            if key not in self.assets:
+                self.assets.store(key, self.assets.surface_from_raw(raw, key[2]))
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        with self._lock:
+            videos, self._videos = list(self._videos.values()), {}
+        for clip in videos:
+            try:
+                clip.close()
+            except Exception:
+                pass
+
+
+class KeyframeIndex:
+    """视频关键帧时间表：首次打开视频时在后台用 ffmpeg 只解码关键帧建立一次，进程内复用
+    
+    ffmpeg 跳转总是从关键帧开始解码，按关键帧对齐可以让进度条拖动只花一次 ffmpeg 启动的时间
+    """
+    _indexes = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.times = []
+        self.ready = threading.Event()
+
+    @classmethod
+    def for_video(cls, path):
+        """取得（必要时在后台开始建立）某个视频的关键帧索引，文件修改后重新建立"""
+        key = (os.path.abspath(path), os.path.getmtime(path))
+        with cls._lock:
+            index = cls._indexes.get(key)
+            if index is None:
+                index = cls._indexes[key] = cls(path)
+                threading.Thread(target=index._build, name="KeyframeIndex", daemon=True).start()
+        return index
+
+    def _build(self):
+        cmd = [ffmpeg_binary(), '-hide_banner', '-nostats',
+               '-skip_frame', 'nokey', '-i', self.path,
+               '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-']
+        try:
+            result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, text=True, errors='replace')
+            self.times = sorted(float(t) for t in re.findall(r'pts_time:\s*(-?[\d.]+)', result.stderr))
+        except Exception as e:
+            print(f"关键帧索引建立失败: {e}")
+        self.ready.set()
+
+    def nearest(self, t):
+        """离 t 最近的关键帧时间；索引尚未建立好时返回 None"""
+        if not self.ready.is_set() or not self.times:
+            return None
+        i = bisect.bisect_left(self.times, t)
+        candidates = self.times[max(0, i - 1):i + 1]
+        return min(candidates, key=lambda k: abs(k - t))
+
+
+class AssetBundle:
+    """安装时生成的预缩放图片包：所有场景用到的图片按显示尺寸解码、缩放好，
+    以原始像素数据连续存放在一个文件里，运行时内存映射后直接构造 Surface，不再解码 JPEG
+    
+    文件格式：MAGIC、4 字节索引长度、JSON 索引，之后从下一个 64 字节边界开始是像素数据。
+    索引记录每张图的 源路径、尺寸 → 偏移（相对像素数据起点）、长度、像素格式，以及生成时源文件的大小和修改时间；
+    源文件变化后对应的条目视为过期，改为读取原图
+    """
+    MAGIC = b'SZJNBDL1'
+    ALIGN = 64
+
+    def __init__(self, path, index, data, data_start):
+        self.path = path
+        self.data_start = data_start
+        self._data = data
+        self._view = memoryview(data)
+        self._entries = {}
+        self.stale = 0
+        for entry in index['entries']:
+            key = self.make_key(entry['path'], entry['size'])
+            if self.is_fresh(entry):
+                self._entries[key] = entry
+            else:
+                self.stale += 1
+
+    @staticmethod
+    def make_key(path, size):
+        return (os.path.normpath(path), tuple(size))
+
+    @staticmethod
+    def source_stamp(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @classmethod
+    def is_fresh(cls, entry):
+        try:
+            return cls.source_stamp(entry['path']) == entry['source']
+        except OSError:
+            return False
+
+    @classmethod
+    def open(cls, path=BUNDLE_FILE):
+        """映射图片包；文件不存在或格式不对时返回 None，调用方退回到读取原图"""
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                    print(f"图片包格式不符，忽略: {path}")
+                    return None
+                index_len, = struct.unpack('<I', f.read(4))
+                index = json.loads(f.read(index_len).decode('utf-8'))
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data_start = cls.align(len(cls.MAGIC) + 4 + index_len)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            print(f"图片包读取失败，改为读取原图: {e}")
+            return None
+        bundle = cls(path, index, data, data_start)
+        if bundle.stale:
+            print(f"图片包中 {bundle.stale} 张图片已过期，这些图片改为读取原图；重新运行 --build-assets 更新")
+        return bundle
+
+    @classmethod
+    def align(cls, offset):
+        return offset + (-offset % cls.ALIGN)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_raw(self, path, size):
+        """返回 (像素数据, 尺寸, 格式)，像素数据是映射内存的切片，不复制；包里没有时返回 None"""
+        if not size:
+            return None
+        entry = self._entries.get(self.make_key(path, size))
+        if entry is None:
+            return None
+        offset = self.data_start + entry['offset']
+        return self._view[offset:offset + entry['length']], tuple(entry['size']), entry['format']
+
+    @classmethod
+    def build(cls, requests, path=BUNDLE_FILE, workers=DECODE_WORKERS):
+        """把 (源路径, 尺寸) 列表解码、缩放后写成图片包，返回写入的图片数；先写临时文件再改名"""
+        requests = list(dict.fromkeys((os.path.normpath(p), tuple(size)) for p, size in requests))
+        entries, chunks = [], []
+        offset = 0
+        for (source, _), (data, size, fmt) in zip(requests, AssetCache.decode_batch(requests, workers)):
+            entries.append({'path': source, 'size': list(size), 'format': fmt,
+                            'offset': offset, 'length': len(data),
+                            'source': cls.source_stamp(source)})
+            chunks.append(data)
+            offset = cls.align(offset + len(data))
+        
+        index = json.dumps({'entries': entries}, ensure_ascii=False).encode('utf-8')
+        temp = path + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(cls.MAGIC)
+            f.write(struct.pack('<I', len(index)))
+            f.write(index)
+            for chunk in chunks:
+                f.write(b'\0' * (cls.align(f.tell()) - f.tell()))
+                f.write(chunk)
+        os.replace(temp, path)
+        return len(entries)
+
+    def close(self):
+        try:
+            self._view.release()
+            self._data.close()
+        except BufferError:
+            # 还有 Surface 直接引用着映射内存（不转换像素格式时），交给垃圾回收释放
+            pass
+
+
+class VideoTranscodeCache:
+    """按显示尺寸预先转码的视频缓存
+    
+    首次运行（或通过 --transcode-video 离线）把视频转码成正好是显示尺寸的副本，
+    文件名带源文件内容哈希，存放在源文件旁边；源文件变化后哈希不同，自动重新转码。
+    播放缓存副本时解码出的帧已是目标尺寸，不需要逐帧缩放
+    
+    同一时间只有一个进程转码：转码前用 O_EXCL 创建锁文件，拿不到锁的进程先播放源文件；
+    ffmpeg 写到带进程号的临时文件，完成后再改名。退出时 abort() 结束还在运行的 ffmpeg，
+    删除临时文件和锁文件
+    """
+    _hashes = {}
+    _jobs = {}
+    _lock = threading.Lock()
+    # 正在运行的转码：ffmpeg 进程 -> (临时文件, 锁文件)
+    _running = {}
+    # 锁文件超过这么久（秒）仍在，视为持有它的进程已经异常退出
+    STALE_LOCK_SECONDS = 3600
+
+    @classmethod
+    def content_hash(cls, path):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+        with cls._lock:
+            digest = cls._hashes.get(key)
+        if digest is None:
+            sha1 = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha1.update(chunk)
+            digest = sha1.hexdigest()[:12]
+            with cls._lock:
+                cls._hashes[key] = digest
+        return digest
+
+    @classmethod
+    def cached_path(cls, path, size):
+        root, ext = os.path.splitext(path)
+        return f"{root}.{size[0]}x{size[1]}.{cls.content_hash(path)}{ext}"
+
+    @classmethod
+    def resolve(cls, path, size, start=True):
+        """返回应播放的文件：缓存副本已就绪时返回副本，否则返回源文件（并在后台开始转码）"""
+        try:
+            cached = cls.cached_path(path, size)
+        except OSError:
+            return path
+        if os.path.exists(cached):
+            return cached
+        if start:
+            cls.start(path, size)
+        return path
+
+    @classmethod
+    def start(cls, path, size):
+        cached = cls.cached_path(path, size)
+        with cls._lock:
+            if cached in cls._jobs:
+                return
+            job = cls._jobs[cached] = threading.Thread(
+                target=cls.transcode, args=(path, size), name="VideoTranscode", daemon=True)
+        job.start()
+
+    @classmethod
+    def acquire_lock(cls, cached):
+        """创建转码锁文件，成功返回锁文件路径；其他进程正在转码时返回 None"""
+        lock = cached + ".lock"
+        for _ in range(2):
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not cls.lock_is_stale(lock):
+                    return None
+                # 持有锁的进程已经不在了，删掉锁再试一次
+                try:
+                    os.remove(lock)
+                except OSError:
+                    return None
+                continue
+            except OSError:
+                return None
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return lock
+        return None
+
+    @classmethod
+    def lock_is_stale(cls, lock):
+        try:
+            with open(lock) as f:
+                pid = int(f.read().strip() or 0)
+            age = time.time() - os.path.getmtime(lock)
+        except (OSError, ValueError):
+            return False
+        if age > cls.STALE_LOCK_SECONDS:
+            return True
+        # Windows 上 os.kill 会结束进程，只按锁文件的年龄判断
+        if os.name == "nt" or pid <= 0:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    @classmethod
+    def abort(cls):
+        """结束正在运行的转码 ffmpeg，删除临时文件和锁文件（退出时调用）"""
+        with cls._lock:
+            running, cls._running = dict(cls._running), {}
+        for proc, (temp, lock) in running.items():
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            for leftover in (temp, lock):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+
+    @classmethod
+    def transcode(cls, path, size):
+        """同步转码，成功返回缓存文件路径；其他进程正在转码或转码失败时返回 None
+        
+        先写临时文件再改名；中途退出时由 abort() 结束 ffmpeg 并删除临时文件，不会留下半个文件
+        """
+        cached = cls.cached_path(path, size)
+        if os.path.exists(cached):
+            return cached
+        lock = cls.acquire_lock(cached)
+        if lock is None:
+            print(f"其他进程正在转码 {cached}，本次播放源文件")
+            return None
+        
+        root, ext = os.path.splitext(cached)
+        # 拿到锁之后，之前异常退出的进程留下的临时文件都可以删掉
+        for leftover in glob.glob(f"{glob.escape(root)}.tmp*{ext}"):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+        temp = f"{root}.tmp{os.getpid()}{ext}"
+        cmd = [ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-y',
+               '-i', path, '-an',
+               '-vf', 'scale=%d:%d:flags=lanczos' % tuple(size),
+               '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p',
+               # 每秒一个关键帧，进度条跳转更精确
+               '-force_key_frames', 'expr:gte(t,n_forced*1)',
+               '-movflags', '+faststart', temp]
+        print(f"开始转码视频: {path} -> {cached}")
+        start = time.perf_counter()
+        proc = None
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+            with cls._lock:
+                cls._running[proc] = (temp, lock)
+            if proc.wait() != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd[0])
+            os.replace(temp, cached)
+        except (OSError, subprocess.CalledProcessError) as e:
+            with cls._lock:
+                aborted = proc is not None and proc not in cls._running
+            print("视频转码已中止" if aborted else f"视频转码失败: {e}")
+            return None
+        finally:
+            with cls._lock:
+                cls._running.pop(proc, None)
+            # 成功时临时文件已经改名；失败或被中断时删掉半个文件
+            for leftover in (temp, lock):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+        print(f"视频转码完成，耗时 {time.perf_counter() - start:.1f} 秒")
+        
+        # 删除源文件旧版本留下的副本；临时文件和锁文件可能属于其他正在转码的进程，不删
+        source_root, source_ext = os.path.splitext(path)
+        for stale in glob.glob(f"{source_root}.{size[0]}x{size[1]}.*{source_ext}"):
+            if stale != cached and '.tmp' not in os.path.basename(stale):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        return cached
+
+
+# 转码线程是守护线程，没经过 Game.cleanup() 的退出也要结束 ffmpeg、删除临时文件
+atexit.register(VideoTranscodeCache.abort)
+
+
+class VideoDecoder:
+    """视频解码线程：ffmpeg 直接输出已缩放到显示尺寸的帧，解码线程把它们读进预先分配的帧槽
+    
+    每个帧槽是一块固定的像素缓冲区，外加一个用 pygame.image.frombuffer 共享这块内存的 Surface，
+    两者都只在创建解码器时分配一次；播放时帧数据直接从管道读进缓冲区，Surface 随之更新，
+    不再逐帧创建 Surface 或复制数组。帧槽在解码线程和主线程之间轮转：
+    解码线程从空闲队列取槽、填入一帧后放进帧队列，主线程换下旧帧时把槽还回空闲队列。
+    
+    主线程按展示时钟从帧队列取帧，从不等待 ffmpeg；解码落后于展示时钟时，
+    来不及显示的帧直接在管道中跳过。seek() 由解码线程在同一个管道上完成跳转
+    """
+    # 帧队列结束标记
+    END = None
+    # 向前跳转不超过这么多帧时沿用当前 ffmpeg 管道顺序解码，否则重启管道
+    REUSE_PIPE_FRAMES = 15
+    # 已通知停止、还在关闭 ffmpeg 管道的解码器，进程退出前由 join_all() 等待
+    stopping = set()
+
+    def __init__(self, clip, size, total_frames, start_frame=0, queue_size=8, keyframes=None):
+        self.clip = clip
+        self.path = clip.filename
+        self.size = size
+        self.fps = clip.fps
+        self.total_frames = total_frames
+        self.start_frame = start_frame
+        self.keyframes = keyframes
+        
+        # 帧槽：解码中一个、队列中最多 queue_size 个，主线程显示中和待显示各一个
+        self.pix_fmt, surface_format, depth = self.frame_format(pygame.display.get_surface())
+        self.frame_bytes = size[0] * size[1] * depth
+        self.slots = []
+        self.free_slots = queue.Queue()
+        for slot in range(queue_size + 3):
+            buffer = bytearray(self.frame_bytes)
+            surface = pygame.image.frombuffer(buffer, size, surface_format)
+            # BGRA 只是为了和显示格式的字节顺序一致，关闭逐像素 alpha 后按不透明图片直接复制
+            surface.set_alpha(None)
+            self.slots.append((buffer, surface))
+            self.free_slots.put(slot)
+        # 跳过迟到帧时的读取缓冲区
+        self._scratch = bytearray(self.frame_bytes)
+        self.queue_size = queue_size
+        self.frames = queue.Queue()
+        
+        # 展示时钟对应的帧号，由主线程更新，解码线程据此丢弃已经迟到的帧
+        self.target_index = start_frame
+        self.decoded = 0
+        self.dropped = 0
+        self.seeks = 0
+        # 每次跳转递增，主线程据此丢弃跳转前解码出的旧帧
+        self.generation = 0
+        self._seek_to = None
+        self.proc = None
+        # 管道中下一帧的帧号
+        self.pos = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="VideoDecoder", daemon=True)
+
+    @staticmethod
+    def frame_format(screen):
+        """选择 ffmpeg 输出的像素格式，返回 (ffmpeg pix_fmt, frombuffer 格式, 每像素字节数)
+        
+        显示格式是常见的 32 位 XRGB（小端内存顺序 B,G,R,X）时直接输出 bgra，
+        blit 时只是内存复制；否则退回 rgb24
+        """
+        if (screen is not None and screen.get_bitsize() == 32 and sys.byteorder == 'little' and
+                screen.get_masks()[:3] == (0xff0000, 0xff00, 0xff)):
+            return 'bgra', 'BGRA', 4
+        return 'rgb24', 'RGB', 3
+
+    def start(self):
+        # moviepy 打开视频时启动的 ffmpeg 进程用不上，先关掉
+        self.clip.reader.close()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        index = self.start_frame
+        try:
+            self._open_pipe(index)
+            while not self._stop.is_set():
+                with self._lock:
+                    seek_to, self._seek_to = self._seek_to, None
+                    generation = self.generation
+                if seek_to is not None:
+                    self._wake.clear()
+                    self.seeks += 1
+                    index = self._reposition(seek_to)
+                
+                if index >= self.total_frames:
+                    # 播放到结尾：通知主线程，然后等待新的跳转请求
+                    self.frames.put((generation, None, None))
+                    while not self._stop.is_set() and not self._wake.wait(0.1):
+                        pass
+                    self._wake.clear()
+                    continue
+                
+                # 已经落后于展示时钟时直接跳到当前应显示的帧
+                target = self.target_index
+                if index < target:
+                    self.dropped += target - index
+                    index = self._reposition(target)
+                    continue
+                
+                slot = self._take_slot()
+                if slot is None:
+                    break
+                if not self._read_into(self.slots[slot][0]):
+                    # 实际帧数比时长推算的少，按结尾处理
+                    self.free_slots.put(slot)
+                    index = self.total_frames
+                    continue
+                self.decoded += 1
+                self.frames.put((generation, index, slot))
+                index += 1
+        except Exception as e:
+            print(f"视频解码错误: {e}")
+            self.frames.put((self.generation, None, None))
+        finally:
+            self._close_pipe()
+            VideoDecoder.stopping.discard(self)
+
+    def _take_slot(self):
+        # 分段等待空闲帧槽，以便及时响应 stop()
+        while not self._stop.is_set():
+            try:
+                return self.free_slots.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _read_into(self, buffer):
+        """从管道读一整帧到 buffer，不分配新内存"""
+        view = memoryview(buffer)
+        got = 0
+        while got < self.frame_bytes:
+            n = self.proc.stdout.readinto(view[got:])
+            if not n:
+                return False
+            got += n
+        self.pos += 1
+        return True
+
+    def _reposition(self, index):
+        """把管道移到 index 帧，返回下一个要解码的帧号"""
+        distance = index - self.pos
+        if self.proc and 0 <= distance <= self.REUSE_PIPE_FRAMES:
+            # 目标就在前方不远处：沿用当前管道，顺序读过中间的帧
+            for _ in range(distance):
+                if not self._read_into(self._scratch):
+                    return self.total_frames
+            return index
+        self._open_pipe(index)
+        return index
+
+    def _open_pipe(self, index):
+        """在 index 帧处（重新）启动 ffmpeg 管道
+        
+        -ss 放在 -i 之前（输入端跳转）：ffmpeg 先定位到之前最近的关键帧，再在内部解码到目标时间，
+        不必把中间帧经管道传回 Python；目标本身就是关键帧时只需解码一帧。
+        缩放也交给 ffmpeg（lanczos），播放按显示尺寸转码好的副本时缩放是空操作
+        """
+        self._close_pipe()
+        cmd = [ffmpeg_binary()]
+        if index:
+            cmd += ['-ss', "%.06f" % (index / self.fps)]
+        cmd += ['-i', self.path,
+                '-loglevel', 'error',
+                '-an',
+                '-f', 'image2pipe',
+                '-vf', 'scale=%d:%d:flags=lanczos' % tuple(self.size),
+                '-pix_fmt', self.pix_fmt,
+                '-vcodec', 'rawvideo', '-']
+        popen_params = {"bufsize": self.frame_bytes * 2,
+                        "stdout": subprocess.PIPE,
+                        "stderr": subprocess.DEVNULL,
+                        "stdin": subprocess.DEVNULL}
+        if os.name == "nt":
+            popen_params["creationflags"] = 0x08000000
+        self.proc = subprocess.Popen(cmd, **popen_params)
+        self.pos = index
+
+    def _close_pipe(self):
+        if self.proc:
+            self.proc.terminate()
+            self.proc.stdout.close()
+            self.proc.wait()
+            self.proc = None
+
+    def seek(self, frame_index, precise=False):
+        """跳转到指定帧，立即返回实际跳转到的帧号，重新定位由解码线程完成
+        
+        precise=True 时精确跳到该帧（ffmpeg 从前一个关键帧解码过去），点击进度条时使用；
+        默认对齐到最近的关键帧，只适合拖动进度条时的预览画面，每次跳转只需启动一次 ffmpeg
+        """
+        frame_index = max(0, min(int(frame_index), self.total_frames - 1))
+        if not precise and self.keyframes is not None:
+            keyframe_time = self.keyframes.nearest(frame_index / self.fps)
+            if keyframe_time is not None:
+                frame_index = min(int(round(keyframe_time * self.fps)), self.total_frames - 1)
+        
+        with self._lock:
+            self.generation += 1
+            self._seek_to = frame_index
+            self.target_index = frame_index
+        self._drain()
+        self._wake.set()
+        return frame_index
+
+    def get_nowait(self):
+        """取出下一帧 (帧号, 帧槽)；队列为空时抛出 queue.Empty，结束时返回 END
+        
+        跳转之前解码出的旧帧在这里丢弃并归还帧槽
+        """
+        while True:
+            generation, index, slot = self.frames.get_nowait()
+            if generation != self.generation:
+                self.release(slot)
+                continue
+            if index is None:
+                return self.END
+            return index, slot
+
+    def surface(self, slot):
+        return self.slots[slot][1]
+
+    def release(self, slot):
+        """主线程不再显示某个帧槽时把它还给解码线程"""
+        if slot is not None:
+            self.free_slots.put(slot)
+
+    def _drain(self):
+        while True:
+            try:
+                _, _, slot = self.frames.get_nowait()
+            except queue.Empty:
+                break
+            self.release(slot)
+
+    def queue_depth(self):
+        return self.frames.qsize()
+
+    def stop(self):
+        """通知解码线程停止后立即返回：结束 ffmpeg 并等它退出要上百毫秒，
+        由解码线程自己关闭管道，不占用主线程的切换帧"""
+        VideoDecoder.stopping.add(self)
+        self._stop.set()
+        self._wake.set()
+        self._drain()
+        if not self._thread.is_alive():
+            VideoDecoder.stopping.discard(self)
+
+    def join(self, timeout=1.0):
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    @classmethod
+    def join_all(cls, timeout=1.0):
+        """进程退出前等待所有正在停止的解码线程关闭各自的 ffmpeg 进程"""
+        for decoder in list(cls.stopping):
+            decoder.join(timeout)
+
+
+class FrameProfiler:
+    """逐帧分阶段计时：保留最近若干帧的耗时用于统计和屏幕叠加显示，
+    需要离线分析时记录全部帧，退出时写成 CSV 或 Chrome trace (chrome://tracing) 文件
+    """
+    PHASES = ('collect', 'switch', 'events', 'update', 'draw', 'overlay', 'present')
+    # 直方图的分桶上界（毫秒），16.7 对应 60 帧的帧预算
+    HISTOGRAM_BOUNDS = (1, 2, 4, 8, 16.7, 33.3, 50)
+    
+    def __init__(self, history=600, csv_path=None, trace_path=None):
+        self.history = deque(maxlen=history)   # (帧开始时间, 总耗时 ms, {阶段: ms})
+        self.csv_path = csv_path
+        self.trace_path = trace_path
+        # 只有需要写文件时才保留全部帧：(帧号, 场景, 帧开始秒, {阶段: ms})
+        self.frames = [] if csv_path or trace_path else None
+        self.frame_count = 0
+        self.origin = time.perf_counter()
+        self.frame_start = None
+        self.last = None
+        self.phases = {}
+        
+        self.overlay = False
+        self.overlay_rect = pygame.Rect(8, 8, 380, 150)
+        self.overlay_surface = None
+        self.overlay_font = None
+        self.overlay_updated = 0
+    
+    def begin_frame(self):
+        self.frame_start = self.last = time.perf_counter()
+        self.phases = {}
+    
+    def mark(self, phase):
+        """把上一个标记到现在的耗时记到 phase 上"""
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + (now - self.last) * 1000
+        self.last = now
+    
+    def end_frame(self, scene_name):
+        if self.frame_start is None:
+            return
+        total = (time.perf_counter() - self.frame_start) * 1000
+        self.history.append((self.frame_start, total, self.phases))
+        if self.frames is not None:
+            self.frames.append((self.frame_count, scene_name, self.frame_start - self.origin, self.phases))
+        self.frame_count += 1
+        self.frame_start = None
+    
+    def fps(self):
+        if len(self.history) < 2:
+            return 0.0
+        elapsed = self.history[-1][0] - self.history[0][0]
+        return (len(self.history) - 1) / elapsed if elapsed > 0 else 0.0
+    
+    def percentile(self, q):
+        """最近若干帧总耗时的百分位数 (ms)"""
+        totals = sorted(total for _, total, _ in self.history)
+        if not totals:
+            return 0.0
+        return totals[min(len(totals) - 1, int(len(totals) * q / 100))]
+    
+    def phase_means(self):
+        sums = dict.fromkeys(self.PHASES, 0.0)
+        for _, _, phases in self.history:
+            for phase, ms in phases.items():
+                sums[phase] += ms
+        n = len(self.history) or 1
+        return {phase: total / n for phase, total in sums.items()}
+    
+    def histogram(self):
+        """最近若干帧总耗时的分布，[(上界 ms, 帧数)]，最后一桶上界为 None"""
+        bounds = self.HISTOGRAM_BOUNDS + (None,)
+        counts = [0] * len(bounds)
+        for _, total, _ in self.history:
+            counts[bisect.bisect_left(self.HISTOGRAM_BOUNDS, total)] += 1
+        return list(zip(bounds, counts))
+    
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.overlay_updated = 0
+    
+    def draw_overlay(self, screen, lines):
+        """在左上角绘制统计信息和最近帧耗时曲线；文字每 0.25 秒刷新一次"""
+        now = time.perf_counter()
+        if self.overlay_surface is None or now - self.overlay_updated > 0.25:
+            self.overlay_updated = now
+            if self.overlay_font is None:
+                self.overlay_font = pygame.font.Font(None, 18)
+            surface = pygame.Surface(self.overlay_rect.size)
+            surface.fill((0, 0, 0))
+            surface.set_alpha(190)
+            y = 4
+            for line in lines:
+                surface.blit(self.overlay_font.render(line, True, (255, 255, 255)), (6, y))
+                y += 16
+            
+            # 最近帧耗时曲线，红线为 60 帧的帧预算
+            graph = pygame.Rect(6, y + 2, self.overlay_rect.width - 12, self.overlay_rect.height - y - 8)
+            scale = graph.height / 33.3
+            budget_y = graph.bottom - int(16.7 * scale)
+            frames = list(self.history)[-graph.width // 2:]
+            for i, (_, total, _) in enumerate(frames):
+                height = min(graph.height, max(1, int(total * scale)))
+                color = (255, 90, 90) if total > 16.7 else (90, 220, 90)
+                pygame.draw.line(surface, color, (graph.left + i * 2, graph.bottom),
+                                 (graph.left + i * 2, graph.bottom - height))
+            pygame.draw.line(surface, (255, 0, 0), (graph.left, budget_y), (graph.right, budget_y))
+            self.overlay_surface = surface
+        screen.blit(self.overlay_surface, self.overlay_rect)
+    
+    def save(self):
+        """把记录的全部帧写到 CSV / Chrome trace 文件"""
+        if not self.frames:
+            return
+        if self.csv_path:
+            with open(self.csv_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(('frame', 'scene', 'start_ms', 'total_ms') + self.PHASES)
+                for index, scene, start, phases in self.frames:
+                    writer.writerow([index, scene, f"{start * 1000:.3f}", f"{sum(phases.values()):.3f}"]
+                                    + [f"{phases.get(phase, 0.0):.3f}" for phase in self.PHASES])
+            print(f"帧耗时已写入 {self.csv_path}")
+        if self.trace_path:
+            # Chrome trace 格式：每帧一个完整事件，各阶段按顺序排在帧内
+            events = []
+            for index, scene, start, phases in self.frames:
+                ts = start * 1e6
+                total = sum(phases.values()) * 1000
+                events.append({'name': scene, 'cat': 'frame', 'ph': 'X', 'pid': 1, 'tid': 1,
+                               'ts': ts, 'dur': total, 'args': {'frame': index}})
+                for phase in self.PHASES:
+                    if phase not in phases:
+                        continue
+                    dur = phases[phase] * 1000
+                    events.append({'name': phase, 'cat': 'phase', 'ph': 'X', 'pid': 1, 'tid': 1,
+                                   'ts': ts, 'dur': dur})
+                    ts += dur
+            with open(self.trace_path, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+            print(f"Chrome trace 已写入 {self.trace_path}")
+    
+    def print_summary(self):
+        print(f"帧耗时：FPS {self.fps():.1f}，p95 {self.percentile(95):.2f} ms，p99 {self.percentile(99):.2f} ms")
+        for bound, count in self.histogram():
+            label = f"<= {bound} ms" if bound is not None else f"> {self.HISTOGRAM_BOUNDS[-1]} ms"
+            print(f"  {label:<12}{count:>6}")
+
+
+class InputLayer:
+    """pygame 事件队列和场景之间的输入层
+    
+    - 只放行当前场景处理的输入事件类型：切换场景时用 pygame.event.set_allowed / set_blocked
+      在 SDL 层面过滤，触摸屏上大量的移动事件不进队列，也不会把空闲模式唤醒
+    - 同一帧里连续的鼠标移动事件合并为一个（位置取最后一个，rel 累加），
+      按下、松开等其他事件的先后顺序不变
+    - 记录输入到画面的延迟：从取出事件到这一帧显示完成；pygame 事件不带时间戳，
+      另记上一次取事件到这一次的间隔，作为事件在队列里等待时间的上限
+    """
+    # 由输入层按场景开关的事件类型；退出、按键（F3）、窗口、音乐结束等事件总是放行
+    MANAGED = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEWHEEL,
+               pygame.FINGERMOTION, pygame.FINGERDOWN, pygame.FINGERUP, pygame.MULTIGESTURE,
+               pygame.KEYUP, pygame.TEXTINPUT, pygame.TEXTEDITING)
+    
+    def __init__(self, coalesce_motion=True, history=600):
+        self.coalesce_motion = coalesce_motion
+        self.blocked = frozenset()
+        self.received = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_frame_events = 0
+        # 有输入的帧：(取事件到显示完成 ms, 距上一次取事件 ms)
+        self.latencies = deque(maxlen=history)
+        self._last_poll = None
+        self._poll_time = None
+        self._frame_has_input = False
+
+    def set_scene(self, scene):
+        """按场景的 input_events 设置 SDL 事件过滤"""
+        allowed = [t for t in self.MANAGED if t in scene.input_events]
+        blocked = [t for t in self.MANAGED if t not in scene.input_events]
+        if pygame.display.get_init():
+            if allowed:
+                pygame.event.set_allowed(allowed)
+            if blocked:
+                pygame.event.set_blocked(blocked)
+        self.blocked = frozenset(blocked)
+
+    def process(self, events, now):
+        """过滤、合并本帧取出的事件，返回交给场景的事件列表"""
+        self._last_poll, self._poll_time = self._poll_time, now
+        self.received += len(events)
+        self.max_frame_events = max(self.max_frame_events, len(events))
+        result = []
+        for event in events:
+            if event.type in self.blocked:
+                # 切换过滤之前已经进队列的事件
+                self.dropped += 1
+                continue
+            if (self.coalesce_motion and event.type == pygame.MOUSEMOTION
+                    and result and result[-1].type == pygame.MOUSEMOTION):
+                previous = result[-1]
+                rel = (previous.rel[0] + event.rel[0], previous.rel[1] + event.rel[1])
+                result[-1] = pygame.event.Event(pygame.MOUSEMOTION, event.dict, rel=rel)
+                self.coalesced += 1
+                continue
+            result.append(event)
+        self.delivered += len(result)
+        self._frame_has_input = any(event.type in self.MANAGED or event.type == pygame.KEYDOWN
+                                    for event in result)
+        return result
+
+    def frame_presented(self, now):
+        """这一帧显示完成后调用，有输入的帧记下延迟"""
+        if not self._frame_has_input:
+            return
+        self._frame_has_input = False
+        wait = (self._poll_time - self._last_poll) * 1000 if self._last_poll is not None else 0.0
+        self.latencies.append(((now - self._poll_time) * 1000, wait))
+
+    def stats(self):
+        latencies = sorted(latency for latency, _ in self.latencies)
+        waits = sorted(wait for _, wait in self.latencies)
+        def pick(values, q):
+            return values[min(len(values) - 1, int(len(values) * q / 100))] if values else 0.0
+        return {
+            'received': self.received,
+            'delivered': self.delivered,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'max_frame_events': self.max_frame_events,
+            'input_frames': len(latencies),
+            'latency_p50_ms': pick(latencies, 50),
+            'latency_p95_ms': pick(latencies, 95),
+            'latency_max_ms': latencies[-1] if latencies else 0.0,
+            'queue_wait_p95_ms': pick(waits, 95),
+        }
+
+
+class MusicPlayer:
+    """背景音乐：通过 pygame.mixer.music 边解码边播放，不把整首曲子解码成 PCM 放在内存里
+    
+    mixer.music 只有一路音乐流，切换曲目时先淡出当前曲目，淡出结束后再淡入下一首
+    """
+    # 音乐停止（包括淡出结束）时发出的事件，空闲模式下可以立即唤醒主循环
+    END_EVENT = pygame.USEREVENT + 1
+    
+    def __init__(self, volume=0.3, fade_ms=800):
+        self.volume = volume
+        self.fade_ms = fade_ms
+        # 正在播放（或正在淡出）的曲目
+        self.current_path = None
+        # 淡出结束后要播放的曲目
+        self.pending_path = None
+        self.fading = False
+        pygame.mixer.music.set_endevent(self.END_EVENT)
+    
+    def play(self, path):
+        """切换到指定曲目，None 表示淡出到静音；和当前曲目相同时继续播放不打断"""
+        if self.fading:
+            self.pending_path = path
+            return
+        if path == self.current_path:
+            return
+        if self.current_path is None or not pygame.mixer.music.get_busy():
+            # 第一首直接以正常音量开始
+            self._start(path, fade_ms=0 if self.current_path is None else self.fade_ms)
+            return
+        self.pending_path = path
+        self.fading = True
+        pygame.mixer.music.fadeout(self.fade_ms)
+    
+    def update(self):
+        """每帧调用：当前曲目淡出结束后开始淡入下一首"""
+        if self.fading and not pygame.mixer.music.get_busy():
+            self.fading = False
+            path, self.pending_path = self.pending_path, None
+            self._start(path, fade_ms=self.fade_ms)
+    
+    def _start(self, path, fade_ms):
+        self.current_path = path
+        if path is None:
+            return
+        pygame.mixer.music.load(path)
+        pygame.mixer.music.set_volume(self.volume)
+        pygame.mixer.music.play(loops=-1, fade_ms=fade_ms)  # loops=-1表示无限循环
+    
+    def stop(self):
+        pygame.mixer.music.stop()
+        pygame.mixer.music.unload()
+        self.current_path = self.pending_path = None
+        self.fading = False
+
+
+# 缓动曲线：把 0~1 的时间进度映射为 0~1 的数值进度
+def ease_linear(t):
+    return t
+
+def ease_out_quad(t):
+    return 1 - (1 - t) * (1 - t)
+
+def ease_in_out_quad(t):
+    return 2 * t * t if t < 0.5 else 1 - 2 * (1 - t) * (1 - t)
+
+def ease_out_cubic(t):
+    return 1 - (1 - t) ** 3
+
+def ease_out_expo(t):
+    # 先快后慢地逼近终点，和每帧移动剩余距离一定比例的效果相同，但在终点时刻准确到位
+    return 1.0 if t >= 1 else 1 - 2 ** (-10 * t)
+
+
+class Tween:
+    """把对象的一个属性在 duration 秒内从 start 补间到 end；两端都是整数时结果取整"""
+    __slots__ = ('target', 'attr', 'start', 'end', 'duration', 'delay', 'ease', 'elapsed', 'integer')
+
+    def __init__(self, target, attr, start, end, duration, delay=0.0, ease=ease_linear):
+        self.target = target
+        self.attr = attr
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.delay = delay
+        self.ease = ease
+        self.elapsed = 0.0
+        self.integer = isinstance(start, int) and isinstance(end, int)
+
+    def value(self):
+        t = (self.elapsed - self.delay) / self.duration if self.duration > 0 else 1.0
+        t = min(1.0, max(0.0, t))
+        value = self.start + (self.end - self.start) * self.ease(t)
+        return round(value) if self.integer else value
+
+    def advance(self, dt):
+        """推进 dt 秒并写回属性，返回补间是否结束"""
+        self.elapsed += dt
+        setattr(self.target, self.attr, self.value())
+        return self.elapsed >= self.delay + self.duration
+
+
+class Timeline:
+    """场景的动画时间线：按经过的真实时间推进所有补间，动画速度和帧率无关
+
+    主循环每帧用同一个时钟调用 update(now)；两帧之间的间隔超过 max_step 时按 max_step 计，
+    卡顿之后动画不会直接跳到终点。time 是进入场景以来的动画时间，闪烁等周期效果据此计算
+    """
+    def __init__(self, max_step=0.25):
+        self.max_step = max_step
+        self.tweens = {}
+        self.time = 0.0
+        self.changed = False
+        self._last = None
+
+    def reset(self):
+        """进入场景时调用：清空补间，动画时间从 0 开始"""
+        self.tweens.clear()
+        self.time = 0.0
+        self.changed = False
+        self._last = None
+
+    def to(self, target, attr, end, duration, ease=ease_linear, delay=0.0, start=None):
+        """开始一个补间，start 默认取属性当前值；同一属性已有的补间被替换"""
+        if start is None:
+            start = getattr(target, attr)
+        else:
+            setattr(target, attr, start)
+        self.tweens[(target, attr)] = Tween(target, attr, start, end, duration, delay, ease)
+
+    def finish(self, target, attr):
+        """让补间立即到达终点"""
+        tween = self.tweens.pop((target, attr), None)
+        if tween is not None:
+            setattr(target, attr, tween.end)
+
+    @property
+    def busy(self):
+        return bool(self.tweens)
+
+    def update(self, now):
+        """推进到时刻 now（秒）；changed 表示本帧有属性被补间改变，包括到达终点的这一帧"""
+        dt = 0.0 if self._last is None else min(self.max_step, max(0.0, now - self._last))
+        self._last = now
+        self.time += dt
+        self.changed = bool(self.tweens)
+        for key, tween in list(self.tweens.items()):
+            if tween.advance(dt):
+                del self.tweens[key]
+
+
 class Scene:
-    def __init__(self, game):
+    # 场景类型名 -> 场景类，场景图数据文件按类型名引用
+    types = {}
+    # 场景的背景音乐，子类可以换成其他曲目，None 表示静音；相同曲目跨场景连续播放
+    music_path = "assets/preview.mp3"
+    # 场景处理的输入事件类型，其余输入事件由输入层过滤掉；大多数场景只响应点击
+    input_events = (pygame.MOUSEBUTTONDOWN,)
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Scene.types[cls.__name__] = cls
+    
+    def __init__(self, game, node):
         self.game = game
+        # 场景图中的节点：场景 id、下一个场景和本场景的内容
+        self.node = node
         self.screen = game.screen
         self.font = game.font
         self.next_scene = None
@@ -18,6 +1523,26 @@ class Scene:
         self.click_delay = 200
         self.click_cooldown = 0
         self.click_ready = True
+        # 脏矩形：None 表示下一帧需要整屏重绘，空列表表示画面没有变化
+        self.dirty_rects = None
+        # 动画时间线，主循环每帧在 update() 之前推进
+        self.timeline = Timeline()
+    
+    def enter(self):
+        """每次进入场景时调用，重置这一次访问的状态
+        
+        场景对象由游戏的场景池复用：__init__ 只做一次的准备（载入图片、合成图层），
+        动画进度、选择结果等每次访问都要重新开始的状态放在这里
+        """
+        self.next_scene = None
+        self.last_click_time = 0
+        self.click_ready = True
+        self.dirty_rects = None
+        self.timeline.reset()
+    
+    def exit(self):
+        """离开场景时调用，释放只在这一次访问期间需要的资源"""
+        pass
         
     def can_handle_click(self):
         current_time = pygame.time.get_ticks()
@@ -26,6 +1551,113 @@ class Scene:
             return True
         return False
     
+    def render_text(self, text, color, alpha=255, font=None):
+        """通过游戏级文字缓存渲染文字，默认使用正文字体"""
+        return self.game.text.render(font or self.font, text, color, alpha=alpha)
+    
+    def mark_dirty(self, rect=None):
+        """标记需要重绘的区域，不传参数表示整屏"""
+        if rect is None:
+            self.dirty_rects = None
+        elif self.dirty_rects is not None:
+            self.dirty_rects.append(pygame.Rect(rect))
+    
+    def take_dirty_rects(self):
+        """取出本帧的脏矩形并清空，供游戏主循环刷新屏幕"""
+        rects = self.dirty_rects
+        self.dirty_rects = []
+        return rects
+    
+    def is_animating(self):
+        """场景是否有持续的动画；没有时主循环进入空闲模式降低刷新率"""
+        return False
+    
+    def profile_stats(self):
+        """性能叠加层上显示的场景自身统计，每项一行文字"""
+        return []
+    
+    @classmethod
+    def required_assets(cls, game, node):
+        """场景自身需要的资源，(类型, 路径, 尺寸, 模式) 列表，用于预取"""
+        return []
+    
+    @classmethod
+    def bundle_assets(cls, node):
+        """生成图片包时这个场景要打包的图片，(路径, 尺寸) 列表；默认取 required_assets 里的图片"""
+        return [(path, size) for kind, path, size, _ in cls.required_assets(None, node)
+                if kind == 'image' and size]
+    
+    def next_nodes(self):
+        """当前场景之后可能进入的场景节点，用于预取"""
+        if self.node.next is None:
+            return []
+        return [self.game.graph.nodes[self.node.next]]
+    
+    def go_next(self):
+        """进入场景图中的下一个场景"""
+        self.next_scene = self.game.scene(self.node.next)
+    
+    def start_prefetch(self):
+        requests = []
+        for node in self.next_nodes():
+            requests.extend(node.scene_class.required_assets(self.game, node))
+        if requests:
+            self.game.preloader.prefetch(requests)
+    
+    @staticmethod
+    def background_assets(game, node):
+        # 只预取这个场景下一次访问时要显示的那一张背景；生成图片包时（game 为 None）打包全部候选背景
+        if game is None:
+            return [('image', path, (800, 600), None) for path in AssetCache.list_images(BACKGROUND_DIR)]
+        path = game.choose_background(node.id)
+        return [('image', path, (800, 600), None)] if path else []
+    
+    def take_random_background(self):
+        """取走为本次访问选定的背景图路径，记下作为合成静态图层的缓存键
+        
+        随机选择在解码之前完成，场景只解码、持有这一张；图片本身由 load_background() 按需载入
+        """
+        self.current_bg_path = self.game.take_background(self.node.id)
+        return self.current_bg_path
+    
+    def load_background(self):
+        if self.current_bg_path is None:
+            return None
+        return self.game.assets.get_image(self.current_bg_path, (800, 600))
+    
+    @staticmethod
+    def make_overlay(size, color, alpha):
+        """纯色半透明遮罩，仅在合成静态图层时使用"""
+        overlay = pygame.Surface(size)
+        overlay.fill(color)
+        overlay.set_alpha(alpha)
+        return overlay
+    
+    def bake_layer(self, layers, fill=None, key=None):
+        """把静态图层按顺序合成为一张显示格式的整屏 Surface
+        
+        layers 为 (Surface, 位置) 列表；给出 key 时结果放进游戏级图片缓存，
+        之后进入同样组合的场景直接复用，每帧只需 blit 这一张。
+        layers 也可以是返回这个列表的函数，缓存命中时不调用，不必为了合成好的图层再解码底图
+        """
+        if key is not None:
+            surface = self.game.assets.get_cached(key)
+            if surface is not None:
+                return surface
+        
+        if callable(layers):
+            layers = layers()
+        surface = pygame.Surface(self.screen.get_size()).convert()
+        if fill is not None:
+            surface.fill(fill)
+        for layer, pos in layers:
+            if layer is not None:
+                surface.blit(layer, pos)
+        
+        if key is not None:
+            self.game.assets.store(key, surface)
+        return surface
+    
     def handle_events(self, events):
         pass
     
@@ -36,358 +1668,288 @@ class Scene:
             self.click_ready = True
     
     def cleanup(self):
-        """清理场景特定的资源"""
-        if hasattr(self, 'bg_images'):
-            self.bg_images = []
-        gc.collect()
+        """场景对象从场景池移除时调用，释放全部资源"""
+        pass
+    
     def draw(self):
         pass
 
 class TitleScene(Scene):
-    def __init__(self, game):
-        super().__init__(game)
+    def __init__(self, game, node):
+        super().__init__(game, node)
         self.title_text = "数字江南·智慧苏州"
         self.subtitle_text = "点击任意键继续..."
-        self.show_subtitle = True
-        self.subtitle_timer = 0
-        
-        # 加载封面背景图
-        self.bg_image = pygame.image.load("assets/cover.jpg")
-        self.bg_image = pygame.transform.scale(self.bg_image, (800, 600))
         
-        # 创建半透明遮罩，让文字更清晰
-        self.overlay = pygame.Surface((800, 600))
-        self.overlay.fill((0, 0, 0))
-        self.overlay.set_alpha(100)
+        # 静态图层：封面、半透明遮罩（让文字更清晰）和标题，合成一次；
+        # 封面只用于合成，不在场景上持有，内存紧张时可以被缓存淘汰
+        title_surface = self.render_text(self.title_text, (255, 255, 255), font=self.game.title_font)
+        title_rect = title_surface.get_rect(center=(self.screen.get_width()//2, 300))
+        self.static_layer = self.bake_layer(lambda: [
+            (self.game.assets.get_image("assets/cover.jpg", (800, 600)), (0, 0)),
+            (self.make_overlay((800, 600), (0, 0, 0), 100), (0, 0)),
+            (title_surface, title_rect),
+        ], key=('layer', 'TitleScene'))
+        
+        # 闪烁提示的区域，切换显示状态时只刷新这一块
+        subtitle_size = self.font.size(self.subtitle_text)
+        self.subtitle_rect = pygame.Rect((0, 0), subtitle_size)
+        self.subtitle_rect.center = (self.screen.get_width()//2, 500)
+    
+    def enter(self):
+        super().enter()
+        self.show_subtitle = True
+    
+    @classmethod
+    def required_assets(cls, game, node):
+        return [('image', "assets/cover.jpg", (800, 600), None)]
     
     def handle_events(self, events):
         for event in events:
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 if self.can_handle_click():
-                    self.next_scene = QuizScene(self.game)
+                    self.go_next()
     
     def update(self):
-        self.subtitle_timer += 1
-        if self.subtitle_timer >= 30:
-            self.show_subtitle = not self.show_subtitle
-            self.subtitle_timer = 0
+        # 每半秒切换一次显示状态，按动画时间计算，空闲帧率下也不会变慢
+        show_subtitle = self.timeline.time % 1.0 < 0.5
+        if show_subtitle != self.show_subtitle:
+            self.show_subtitle = show_subtitle
+            self.mark_dirty(self.subtitle_rect)
     
     def draw(self):
-        # 绘制背景图
-        self.screen.blit(self.bg_image, (0, 0))
-        # 绘制遮罩
-        self.screen.blit(self.overlay, (0, 0))
-        
-        # 使用大号字体绘制标题
-        title_surface = self.game.title_font.render(self.title_text, True, (255, 255, 255))
-        title_rect = title_surface.get_rect(center=(self.screen.get_width()//2, 300))
-        self.screen.blit(title_surface, title_rect)
+        # 背景、遮罩和标题已合成为一张静态图层
+        self.screen.blit(self.static_layer, (0, 0))
         
         if self.show_subtitle:
-            subtitle_surface = self.font.render(self.subtitle_text, True, (200, 200, 200))
+            subtitle_surface = self.render_text(self.subtitle_text, (200, 200, 200))
             subtitle_rect = subtitle_surface.get_rect(center=(self.screen.get_width()//2, 500))
             self.screen.blit(subtitle_surface, subtitle_rect)
 
-class BaseIntroductionScene(Scene):
-    def __init__(self, game):
-        super().__init__(game)
-        
-        # 动画相关属性
-        self.animation_speed = 8
-        self.image_alpha = 0
-        self.image_x = 800
+class IntroductionScene(Scene):
+    """园林介绍：左侧文字、右侧图片，内容来自场景图节点的 text 和 image"""
+    # 节点没有指定图片时右侧展示的图片
+    image_path = "assets/fengjing2.jpg"
+    
+    def __init__(self, game, node):
+        super().__init__(game, node)
+        self.text = node.params['text']
+        self.image_path = node.params.get('image', self.image_path)
+        
+        # 入场动画：图片从右侧滑入，文字和图片同时淡入（秒）
+        self.slide_duration = 0.6
+        self.fade_duration = 0.5
         self.target_image_x = 520
-        self.text_alpha = 0
-        self.animation_complete = False
         
         # 文字位置相关
         self.text_y = 120
         self.target_text_y = 120
         
         # 添加点击提示相关属性
-        self.show_continue = False
         self.continue_text = "点击继续..."
+        self.continue_rect = pygame.Rect((0, 0), self.font.size(self.continue_text))
+        self.continue_rect.center = (400, 550)
+        
+        # 加载右侧展示图片；淡入时通过透明度视图绘制，不必每帧复制
+        self.image = self.game.assets.get_image(self.image_path, (230, 280))
+        self.image_view = AlphaView(self.image) if self.image else None
+    
+    def enter(self):
+        super().enter()
+        self.timeline.to(self, 'image_x', self.target_image_x, self.slide_duration, ease_out_cubic, start=800)
+        self.timeline.to(self, 'image_alpha', 255, self.fade_duration, start=0)
+        self.timeline.to(self, 'text_alpha', 255, self.fade_duration, start=0)
+        self.animation_complete = False
+        self.show_continue = False
         self.continue_alpha = 128
         
-        # 加载背景图片
-        self.bg_images = []
-        self.load_background_images()
-        self.current_bg = self.get_random_background()
-        
-        # 加载右侧展示图片
-        self.image = pygame.image.load("assets/fengjing2.jpg")
-        self.image = pygame.transform.scale(self.image, (230, 280))
-
-    def load_background_images(self):
-        image_dir = "assets/image"
-        for file in os.listdir(image_dir):
-            if file.endswith(('.jpg', '.jpeg', '.png')) and file != 'guide.png':
-                image_path = os.path.join(image_dir, file)
-                image = pygame.image.load(image_path)
-                image = pygame.transform.scale(image, (800, 600))
-                self.bg_images.append(image)
-    
-    def get_random_background(self):
-        if self.bg_images:
-            return random.choice(self.bg_images)
-        return None
+        # 每次进入随机换一张背景；静态图层按背景缓存：背景加白色半透明遮罩，
+        # 入场动画结束后再合成包含文字和图片的版本
+        self.take_random_background()
+        self.base_layer = self.bake_layer(lambda: [
+            (self.load_background(), (0, 0)),
+            (self.make_overlay((800, 600), (255, 255, 255), 180), (0, 0)),
+        ], key=('layer', 'intro', self.current_bg_path))
+        self.settled_layer = None
+    
+    def exit(self):
+        # 合成好的图层留在缓存里，下次访问命中时复用；场景不持有它们，预算才能约束住内存
+        self.base_layer = None
+        self.settled_layer = None
+    
+    @classmethod
+    def required_assets(cls, game, node):
+        return cls.background_assets(game, node) + [('image', node.params.get('image', cls.image_path), (230, 280), None)]
         
     def update(self):
-        # 更新动画状态
-        if self.image_x > self.target_image_x:
-            self.image_x = max(self.target_image_x, self.image_x - self.animation_speed)
-            
-        if self.image_alpha < 255:
-            self.image_alpha = min(255, self.image_alpha + self.animation_speed)
-            
-        if self.text_alpha < 255:
-            self.text_alpha = min(255, self.text_alpha + self.animation_speed)
-        
+        # 入场动画期间图片和文字都在变化，整屏重绘
+        if self.timeline.changed:
+            self.mark_dirty()
         # 检查动画是否完成
-        if (self.image_x == self.target_image_x and 
-            self.image_alpha == 255 and 
-            self.text_alpha == 255):
+        if not self.timeline.busy and not self.animation_complete:
             self.animation_complete = True
+            self.mark_dirty()
             
         # 当动画完成后显示提示
         if self.animation_complete:
             self.show_continue = True
             # 让提示闪烁
-            self.continue_alpha = 128 + int(127 * math.sin(pygame.time.get_ticks() / 500))
+            self.continue_alpha = 128 + int(127 * math.sin(self.timeline.time * 2))
+            self.mark_dirty(self.continue_rect)
             
         # 更新点击就绪状态
         super().update()  # 确保调用父类的update方法
 
     def draw(self):
-        # 绘制背景
-        if self.current_bg:
-            self.screen.blit(self.current_bg, (0, 0))
-        
-        # 添加半透明遮罩
-        overlay = pygame.Surface((800, 600))
-        overlay.fill((255, 255, 255))
-        overlay.set_alpha(180)
-        self.screen.blit(overlay, (0, 0))
-        
+        if self.animation_complete:
+            # 动画结束后文字和图片不再变化，整体作为一张静态图层
+            if self.settled_layer is None:
+                self.settled_layer = self.bake_settled_layer()
+            self.screen.blit(self.settled_layer, (0, 0))
+        else:
+            # 背景和遮罩
+            self.screen.blit(self.base_layer, (0, 0))
+            self.draw_content(self.screen)
+        # 绘制继续提示
+        if self.show_continue and self.animation_complete:
+            continue_surface = self.render_text(self.continue_text, (0, 0, 0), self.continue_alpha)
+            continue_rect = continue_surface.get_rect(center=(400, 550))
+            self.screen.blit(continue_surface, continue_rect)
+            
+
+    def draw_content(self, target):
         # 绘制文本（整段动画）
         y_offset = self.text_y
         for line in self.text:
             if line.strip():  # 跳过空行
-                text_surface = self.font.render(line, True, (0, 0, 0))
-                text_surface.set_alpha(self.text_alpha)
+                text_surface = self.render_text(line, (0, 0, 0), self.text_alpha)
                 text_rect = text_surface.get_rect(left=50, top=y_offset)
-                self.screen.blit(text_surface, text_rect)
+                target.blit(text_surface, text_rect)
             y_offset += 35  # 行间距
         
         # 绘制右侧图片
-        if self.image:
-            temp_surface = self.image.copy()
-            temp_surface.set_alpha(self.image_alpha)
-            self.screen.blit(temp_surface, (self.image_x, 160))
-        # 绘制继续提示
-        if self.show_continue and self.animation_complete:
-            continue_surface = self.font.render(self.continue_text, True, (0, 0, 0))
-            continue_surface.set_alpha(self.continue_alpha)
-            continue_rect = continue_surface.get_rect(center=(400, 550))
-            self.screen.blit(continue_surface, continue_rect)
-            
+        if self.image_view:
+            self.image_view.blit(target, (self.image_x, 160), self.image_alpha)
+
+    def bake_settled_layer(self):
+        key = ('layer', self.node.id, self.current_bg_path, 'settled')
+        surface = self.game.assets.get_cached(key)
+        if surface is None:
+            surface = self.base_layer.copy()
+            self.draw_content(surface)
+            self.game.assets.store(key, surface)
+        return surface
+
+    def is_animating(self):
+        # 入场动画结束后提示仍在平滑闪烁
+        return True
 
     def cleanup(self):
         """清理场景特定的资源"""
-        if hasattr(self, 'bg_images'):
-            self.bg_images = []
         if hasattr(self, 'image'):
             self.image = None
-        if hasattr(self, 'current_bg'):
-            self.current_bg = None
-        gc.collect()
+        self.image_view = None
+        self.base_layer = None
+        self.settled_layer = None
         
     def handle_events(self, events):
         for event in events:
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 if self.can_handle_click() and self.animation_complete:
-                    next_scene = self.get_next_scene()
-                    if next_scene:
-                        self.next_scene = next_scene
-                        return
-    def get_next_scene(self):
-        # 子类需要实现这个方法
-        return None
-                
-class IntroductionScene1(BaseIntroductionScene):
-    def __init__(self, game):
-        self.text = [
-            "拙政园，始建于明正德初年(1509-1516)，",
-            "是苏州现存最大的古典园林。",
-            "",
-            "它以其独特的'一园三区'布局闻名于世，",
-            "东区以建筑为主，中区以水景为主，",
-            "西区以山景为主，体现了'咫尺之内，",
-            "自成天地'的园林特色。",
-            "",
-            "园内亭台楼阁、山水花木相映成趣，",
-            "处处体现'虽由人作，宛自天开'的意境。"
-        ]
-        super().__init__(game)
-        
-        # 加载拙政园特定图片
-        self.image = pygame.image.load("assets/zhuozhengyuan.jpg")
-        self.image = pygame.transform.scale(self.image, (230, 280))
-    def get_next_scene(self):
-        return QuizScene(self.game)
-                
-class IntroductionScene2(BaseIntroductionScene):
-    def __init__(self, game):
-        self.text = [
-            "苏州园林的'移步换景'是其最显著的特色，",
-            "游客每走几步就能看到不同的景致。",
-            "",
-            "这种设计理念通过精心布局，将有限的",
-            "空间营造出无限的景观变化。",
-            "",
-            "园中的曲廊、游廊既是观景的途径，",
-            "也是景观的一部分，将游览体验和",
-            "艺术欣赏完美结合。"
-        ]
-        super().__init__(game)
-    def get_next_scene(self):
-        return QuizScene(self.game)
-
-class IntroductionScene3(BaseIntroductionScene):
-    def __init__(self, game):
-        self.text = [
-            "在数字化时代，苏州园林正在经历创新性的转变。",
-            "通过科技手段，这些古老的园林焕发新生。",
-            "",
-            "数字化保护不仅包括3D扫描建档、VR复原，",
-            "还包括智能管理系统的应用。",
-            "",
-            "游客可以通过手机APP获取园林导览，",
-            "体验AR增强现实技术带来的互动体验。",
-            "",
-            "这种传统与现代的结合，让人们能更好地理解和欣赏园林文化。"
-        ]
-        super().__init__(game)
-        self.image = pygame.image.load("assets/vr.jpg")
-        self.image = pygame.transform.scale(self.image, (230, 280))
+                    self.go_next()
+                    return
 
-    def get_next_scene(self):
-        print("Creating PuzzleScene") # 添加调试输出
-        return PuzzleScene(self.game)
-                    
 class QuizScene(Scene):
-    def __init__(self, game):
-        super().__init__(game)
-        # 删除原来的全局变量检查
-        # if not hasattr(QuizScene, 'global_question'):
-        #     QuizScene.global_question = 0
-        
-        # 使用游戏实例的问题序号
-        self.current_question = self.game.current_question
-        
+    def __init__(self, game, node):
+        super().__init__(game, node)
+        # 题目来自场景图节点，解析场景图时统一编号
+        self.question = node.params['question']
+        self.number = node.params['number']
         
         # 加载导游图片
-        self.guide_image = pygame.image.load("assets/guide.png")
-        self.guide_image = pygame.transform.scale(self.guide_image, (150, 200))
-        
-        # 背景图片列表
-        self.bg_images = []
-        self.load_background_images()
-        self.current_bg = self.get_random_background()
-        
-        # 动画相关的属性
-        self.dialog_alpha = 0
-        self.options_alpha = [0] * 4
-        self.animation_speed = 5
-        self.dialog_box_y = -100
+        self.guide_image = self.game.assets.get_image("assets/guide.png", (150, 200))
+        
+        # 入场动画：对话框滑入并淡入，之后选项淡入（秒）
+        self.slide_duration = 1.0
+        self.fade_duration = 0.85
         self.target_dialog_y = 150
+        
+        # 对话框
+        self.dialog_box = pygame.Surface((500, 80))
+        self.dialog_box.fill((245, 245, 245))
+        pygame.draw.rect(self.dialog_box, (100, 100, 100), self.dialog_box.get_rect(), 2)
+        
+        # 选中选项的背景和结果提示的底板，创建一次每帧复用
+        self.button_bg = pygame.Surface((400, 40))
+        self.button_bg.fill((220, 220, 220))
+        self.result_bg = self.make_overlay((400, 100), (255, 255, 255), 200)
+    
+    def enter(self):
+        super().enter()
+        self.timeline.to(self, 'dialog_box_y', self.target_dialog_y, self.slide_duration, ease_out_expo, start=-100)
+        self.timeline.to(self, 'dialog_alpha', 255, self.fade_duration, start=0)
+        # 对话框透明度到 200 时选项开始淡入
+        self.timeline.to(self, 'options_alpha', 255, self.fade_duration,
+                         delay=self.fade_duration * 200 / 255, start=0)
         self.result_alpha = 0
         self.result_y = 650
         
-        self.questions = [
-            {
-                'text': "苏州最大的园林是哪一座？",
-                'options': ["拙政园", "留园", "狮子林", "网师园"],
-                'correct': 0,
-                'description': "拙政园是苏州最大的古典园林。"
-            },
-            {
-                'text': "苏州园林最著名的造园理念是什么？",
-                'options': ["小中见大", "移步换景", "借景抄园", "虚实相生"],
-                'correct': 1,
-                'description': "移步换景是苏州园林的精髓。"
-            },
-            {
-                'text': "数字技术在苏州园林中的创新应用是？",
-                'options': [
-                    "VR实景导览", 
-                    "电子讲解器", 
-                    "环境监测", 
-                    "智能灯光"
-                ],
-                'correct': 0,
-                'description': "VR实景导览让游客足不出户也能身临其境。"
-            }
-        ]
-        
         self.selected_option = None
         self.show_result = False
         self.answered_correctly = False
         
-        # 创建半透明遮罩
-        self.overlay = pygame.Surface((800, 600))
-        self.overlay.fill((255, 255, 255))
-        self.overlay.set_alpha(180)
-        
-        # 对话框
-        self.dialog_box = pygame.Surface((500, 80))
-        self.dialog_box.fill((245, 245, 245))
-        pygame.draw.rect(self.dialog_box, (100, 100, 100), self.dialog_box.get_rect(), 2)
+        # 每次进入随机换一张背景；静态图层：背景、白色半透明遮罩、导游图片和题号
+        self.take_random_background()
+        self.base_layer = self.bake_layer(lambda: [
+            (self.load_background(), (0, 0)),
+            (self.make_overlay((800, 600), (255, 255, 255), 180), (0, 0)),
+            (self.guide_image, (30, 150)),
+            (self.render_text(f"第 {self.number} 题", (0, 0, 0)), (30, 20)),
+        ], key=('layer', self.node.id, self.current_bg_path))
+        # 对话框滑入结束后，再把对话框和题目合成进去
+        self.settled_layer = None
 
-    def load_background_images(self):
-        image_dir = "assets/image"
-        for file in os.listdir(image_dir):
-            if file.endswith(('.jpg', '.jpeg', '.png')) and file != 'guide.png':
-                image_path = os.path.join(image_dir, file)
-                image = pygame.image.load(image_path)
-                image = pygame.transform.scale(image, (800, 600))
-                self.bg_images.append(image)
-
-    def get_random_background(self):
-        if self.bg_images:
-            return random.choice(self.bg_images)
-        return None
+    def exit(self):
+        self.base_layer = None
+        self.settled_layer = None
+
+    @classmethod
+    def required_assets(cls, game, node):
+        return cls.background_assets(game, node) + [('image', "assets/guide.png", (150, 200), None)]
 
     def update(self):
-        if self.dialog_box_y < self.target_dialog_y:
-            self.dialog_box_y += (self.target_dialog_y - self.dialog_box_y) * 0.1
-        
-        if self.dialog_alpha < 255:
-            self.dialog_alpha = min(255, self.dialog_alpha + self.animation_speed)
+        if self.timeline.changed:
+            self.mark_dirty()
+
+    def is_animating(self):
+        return self.timeline.busy
+
+    def draw_dialog(self, target):
+        # 对话框是本场景独有的 Surface，直接设置透明度，不必每帧复制
+        self.dialog_box.set_alpha(self.dialog_alpha)
+        target.blit(self.dialog_box, (200, self.dialog_box_y))
         
-        for i in range(4):
-            if self.dialog_alpha >= 200:
-                self.options_alpha[i] = min(255, self.options_alpha[i] + self.animation_speed)
+        question_surface = self.render_text(self.question['text'], (0, 0, 0), self.dialog_alpha)
+        target.blit(question_surface, (220, self.dialog_box_y + 20))
+
+    def bake_settled_layer(self):
+        key = ('layer', self.node.id, self.current_bg_path, 'settled')
+        surface = self.game.assets.get_cached(key)
+        if surface is None:
+            surface = self.base_layer.copy()
+            self.draw_dialog(surface)
+            self.game.assets.store(key, surface)
+        return surface
 
     def draw(self):
-        if self.current_bg:
-            self.screen.blit(self.current_bg, (0, 0))
-        self.screen.blit(self.overlay, (0, 0))
-        
-        current_q = self.questions[self.current_question]
-        
-        self.screen.blit(self.guide_image, (30, 150))
+        current_q = self.question
         
-        title = self.font.render(f"第 {self.current_question + 1} 题", True, (0, 0, 0))
-        self.screen.blit(title, (30, 20))
-        
-        dialog_surface = self.dialog_box.copy()
-        dialog_surface.set_alpha(self.dialog_alpha)
-        self.screen.blit(dialog_surface, (200, self.dialog_box_y))
-        
-        question_surface = self.font.render(current_q['text'], True, (0, 0, 0))
-        question_surface.set_alpha(self.dialog_alpha)
-        self.screen.blit(question_surface, (220, self.dialog_box_y + 20))
+        if self.is_animating():
+            self.screen.blit(self.base_layer, (0, 0))
+            self.draw_dialog(self.screen)
+        else:
+            if self.settled_layer is None:
+                self.settled_layer = self.bake_settled_layer()
+            self.screen.blit(self.settled_layer, (0, 0))
         
         # 绘制选项
         for i, option in enumerate(current_q['options']):
@@ -396,9 +1958,7 @@ class QuizScene(Scene):
             # 绘制按钮背景
             if self.selected_option == i:
                 # 选中状态的背景色
-                button_bg = pygame.Surface((400, 40))
-                button_bg.fill((220, 220, 220))
-                self.screen.blit(button_bg, button_rect)
+                self.screen.blit(self.button_bg, button_rect)
             
             # 绘制按钮边框
             pygame.draw.rect(self.screen, (100, 100, 100), button_rect, 2)
@@ -411,25 +1971,22 @@ class QuizScene(Scene):
                 elif i == self.selected_option and i != current_q['correct']:
                     color = (155, 0, 0)  # 错误选择显示红色
             
-            text = self.font.render(f"{chr(65+i)}. {option}", True, color)
+            text = self.render_text(f"{chr(65+i)}. {option}", color)
             text_rect = text.get_rect(left=220, centery=button_rect.centery)
             self.screen.blit(text, text_rect)
         
         if self.show_result:
-            result_bg = pygame.Surface((400, 100))
-            result_bg.fill((255, 255, 255))
-            result_bg.set_alpha(200)
-            self.screen.blit(result_bg, (200, 450))
+            self.screen.blit(self.result_bg, (200, 450))
             
             result_text = "回答正确！" if self.answered_correctly else "回答错误！"
             result_color = (0, 255, 0) if self.answered_correctly else (255, 0, 0)
-            result_surface = self.font.render(result_text, True, result_color)
+            result_surface = self.render_text(result_text, result_color)
             self.screen.blit(result_surface, (200, 450))
             
-            desc = self.font.render(current_q['description'], True, (0, 0, 0))
+            desc = self.render_text(current_q['description'], (0, 0, 0))
             self.screen.blit(desc, (200, 480))
             
-            next_text = self.font.render("点击继续", True, (0, 0, 0))
+            next_text = self.render_text("点击继续", (0, 0, 0))
             self.screen.blit(next_text, (200, 550))
 
     def handle_events(self, events):
@@ -441,262 +1998,504 @@ class QuizScene(Scene):
                 mouse_pos = event.pos
                 if not self.show_result:
                     # 检查选项点击
-                    for i, option in enumerate(self.questions[self.current_question]['options']):
+                    for i, option in enumerate(self.question['options']):
                         option_rect = pygame.Rect(200, 250 + i*45, 400, 40)
                         if option_rect.collidepoint(mouse_pos):
                             self.selected_option = i
                             self.show_result = True
-                            self.answered_correctly = (i == self.questions[self.current_question]['correct'])
-                            self.dialog_alpha = 255
+                            self.answered_correctly = (i == self.question['correct'])
+                            self.timeline.finish(self, 'dialog_alpha')
+                            self.mark_dirty()
                             return
                 
                 elif self.show_result:
-                    # 使用游戏实例的问题序号，而不是类变量
-                    self.game.current_question += 1
-                    
-                    # 根据当前问题序号决定下一个场景
-                    if self.game.current_question == 1:
-                        self.next_scene = IntroductionScene1(self.game)
-                    elif self.game.current_question == 2:
-                        self.next_scene = IntroductionScene2(self.game)
-                    elif self.game.current_question == 3:
-                        self.next_scene = IntroductionScene3(self.game)
-                    elif self.game.current_question >= len(self.questions):
-                        self.next_scene = PuzzleScene(self.game)                
+                    # 下一个场景由场景图决定
+                    self.go_next()
+
+class PuzzlePiece:
+    """一块拼图：原图中的序号、图像、当前位置、正确位置，以及层级和所在的空间网格范围
+    
+    矩形块的 surface 是原图的子 Surface，不单独占用像素内存；异形块没有自己的 Surface，
+    source 是它在原图中的矩形（含四周的凸起余量），mask 是同样边形状的块共用的 1 位遮罩，
+    用于绘制和精确拾取
+    """
+    __slots__ = ('index', 'surface', 'source', 'mask', 'rect', 'target', 'correct', 'z', 'cells')
+
+    def __init__(self, index, surface, rect, target, mask=None, source=None):
+        self.index = index
+        self.surface = surface
+        self.source = source
+        self.mask = mask
+        self.rect = rect
+        self.target = target
+        self.correct = False
+        self.z = 0
+        self.cells = None
+
+
+class PuzzleBoard:
+    """rows x cols 的拼图：切块、打乱、拾取、拖动、吸附和完成判断，不依赖场景，可单独做基准测试
+    
+    拼图块登记在覆盖 bounds 的均匀网格里，网格单元与格子一样大，矩形块最多落在 4 个单元中，
+    异形块四周各大 margin，最多落在 9 个单元中；
+    拾取和局部重绘只检查相关单元里的块，与总块数无关。
+    层级用 OrderedDict 保存（后面的在上层），置顶是 O(1) 的 move_to_end；
+    同一单元里的候选块用 z 比较上下。
+    
+    shape 为 'rect' 时拼图块直接是原图的子 Surface，不复制像素；为 'jigsaw' 时块带凸起和凹口，
+    块的矩形比格子四周各大 margin（凸起的高度），绘制时按形状遮罩从原图取像素，同样不复制原图
+    """
+    SHAPES = ('rect', 'jigsaw')
+    
+    def __init__(self, image, area_topleft, rows, cols, bounds, shape='rect'):
+        if shape not in self.SHAPES:
+            raise ValueError(f"未知的拼图形状: {shape}")
+        self.rows = rows
+        self.cols = cols
+        self.shape = shape
+        width, height = image.get_size()
+        self.piece_w = width // cols
+        self.piece_h = height // rows
+        self.margin = min(self.piece_w, self.piece_h) // 5 if shape == 'jigsaw' else 0
+        self.area = pygame.Rect(area_topleft, (self.piece_w * cols, self.piece_h * rows))
+        # 吸附阈值：块中心离正确位置不到半块
+        self.snap_distance = min(self.piece_w, self.piece_h) // 2
+        
+        self.bounds = pygame.Rect(bounds)
+        self.grid_cols = -(-self.bounds.width // self.piece_w)
+        self.grid_rows = -(-self.bounds.height // self.piece_h)
+        self.cells = [set() for _ in range(self.grid_cols * self.grid_rows)]
+        
+        self.pieces = []
+        self.order = OrderedDict()   # 序号 -> 拼图块，按绘制顺序
+        self.correct_count = 0
+        self._z = 0
+        self.image = image
+        # 异形拼图：边形状 -> 共用的遮罩，以及绘制时取像素用的临时 Surface；矩形拼图不需要
+        self.shapes = {}
+        self.scratch = None
+        if shape == 'jigsaw':
+            self.create_jigsaw_pieces(image)
+        else:
+            self.create_pieces(image)
+
+    def create_pieces(self, image):
+        """切出拼图块，只在创建时做一次；块是原图的子 Surface，与原图共用像素"""
+        for i in range(self.rows * self.cols):
+            col, row = i % self.cols, i // self.cols
+            source = pygame.Rect(col * self.piece_w, row * self.piece_h, self.piece_w, self.piece_h)
+            target = (self.area.left + source.x, self.area.top + source.y)
+            self.pieces.append(PuzzlePiece(i, image.subsurface(source), pygame.Rect((0, 0), source.size), target))
+
+    def edge_shapes(self):
+        """每块四条边 (上, 右, 下, 左) 的形状：1 凸起、-1 凹口、0 平边（外框）
+        
+        相邻两块共用一条边，一块凸起另一块就是凹口；按行列数固定随机种子，同一拼图每次形状相同
+        """
+        rng = random.Random(self.rows * 1000 + self.cols)
+        # 每块右边和下边的形状，左边和上边取左侧、上方那块的相反值
+        right = [[rng.choice((1, -1)) if c < self.cols - 1 else 0 for c in range(self.cols)] for _ in range(self.rows)]
+        down = [[rng.choice((1, -1)) if r < self.rows - 1 else 0 for _ in range(self.cols)] for r in range(self.rows)]
+        return [
+            (-down[r - 1][c] if r else 0, right[r][c], down[r][c], -right[r][c - 1] if c else 0)
+            for r in range(self.rows) for c in range(self.cols)
+        ]
+
+    def create_jigsaw_pieces(self, image):
+        """生成异形拼图块：遮罩按四条边的形状生成，同样形状的块共用一个（最多 3^4 种）
+        
+        凸起是一个圆，和边相交形成细颈；相邻块的凹口用同一个圆挖掉，两块严丝合缝。
+        块不保存像素，绘制时由 draw_piece 从原图取
+        """
+        pw, ph, m = self.piece_w, self.piece_h, self.margin
+        cell_w, cell_h = pw + 2 * m, ph + 2 * m
+        radius = max(1, m * 55 // 100)
+        knob = pygame.mask.from_surface(self.circle_surface(radius))
+        body = pygame.mask.Mask((pw, ph), fill=True)
+        # 圆在块格子中的左上角，四条边依次为 上、右、下、左：
+        # 凸起的圆心在边外 (m - radius) 处，外沿正好到格子边界；凹口是相邻块的凸起，圆心在边内同样距离处
+        knob_offsets = (
+            (m + pw // 2 - radius, 0),
+            (pw + 2 * m - 2 * radius, m + ph // 2 - radius),
+            (m + pw // 2 - radius, ph + 2 * m - 2 * radius),
+            (0, m + ph // 2 - radius),
+        )
+        blank_offsets = (
+            (m + pw // 2 - radius, 2 * m - 2 * radius),
+            (pw, m + ph // 2 - radius),
+            (m + pw // 2 - radius, ph),
+            (2 * m - 2 * radius, m + ph // 2 - radius),
+        )
+        
+        self.scratch = pygame.Surface((cell_w, cell_h), pygame.SRCALPHA)
+        for i, edges in enumerate(self.edge_shapes()):
+            col, row = i % self.cols, i // self.cols
+            mask = self.shapes.get(edges)
+            if mask is None:
+                mask = pygame.mask.Mask((cell_w, cell_h))
+                mask.draw(body, (m, m))
+                for edge, kind in enumerate(edges):
+                    if kind > 0:
+                        mask.draw(knob, knob_offsets[edge])
+                    elif kind < 0:
+                        mask.erase(knob, blank_offsets[edge])
+                self.shapes[edges] = mask
+            
+            # 外框上的块的 source 会超出原图，超出的部分都在平边之外，遮罩为空
+            source = pygame.Rect(col * pw - m, row * ph - m, cell_w, cell_h)
+            target = (self.area.left + source.x, self.area.top + source.y)
+            self.pieces.append(PuzzlePiece(i, None, pygame.Rect((0, 0), source.size), target, mask, source))
+
+    @staticmethod
+    def circle_surface(radius):
+        surface = pygame.Surface((2 * radius, 2 * radius), pygame.SRCALPHA)
+        pygame.draw.circle(surface, (255, 255, 255, 255), (radius, radius), radius)
+        return surface
+
+    def draw_piece(self, target, piece):
+        """把拼图块画到 target 上；异形块先从原图拷到临时 Surface，再把遮罩之外的像素清成透明"""
+        if piece.mask is None:
+            target.blit(piece.surface, piece.rect)
+            return
+        if self.image.get_flags() & pygame.SRCALPHA:
+            # 带透明通道的原图会与临时 Surface 上一块的残留混合
+            self.scratch.fill((0, 0, 0, 0))
+        self.scratch.blit(self.image, (0, 0), piece.source)
+        piece.mask.to_surface(self.scratch, setcolor=None, unsetcolor=(0, 0, 0, 0))
+        target.blit(self.scratch, piece.rect)
+
+    def pixel_bytes(self):
+        """拼图块在原图之外额外占用的内存：共用的形状遮罩和临时 Surface"""
+        if self.scratch is None:
+            return 0
+        masks = sum((mask.get_size()[0] + 7) // 8 * mask.get_size()[1] for mask in self.shapes.values())
+        return self.scratch.get_pitch() * self.scratch.get_height() + masks
+
+    def shuffle(self):
+        """把拼图块随机放到拼图区域的各个格子上，层级恢复为序号顺序"""
+        slots = list(range(len(self.pieces)))
+        random.shuffle(slots)
+        for cell in self.cells:
+            cell.clear()
+        self.order.clear()
+        self.correct_count = 0
+        self._z = 0
+        for piece, slot in zip(self.pieces, slots):
+            piece.rect.topleft = (self.area.left + slot % self.cols * self.piece_w - self.margin,
+                                  self.area.top + slot // self.cols * self.piece_h - self.margin)
+            # 打乱后恰好在正确格子上的块直接算作拼好
+            piece.correct = piece.rect.topleft == piece.target
+            self.correct_count += piece.correct
+            piece.cells = None
+            self.update_cells(piece)
+            self.raise_piece(piece)
+
+    def cell_range(self, rect):
+        """rect 覆盖的网格单元范围 (列起, 行起, 列止, 行止)，超出 bounds 的部分夹到边上"""
+        left = rect.left - self.bounds.left
+        top = rect.top - self.bounds.top
+        return (min(max(left // self.piece_w, 0), self.grid_cols - 1),
+                min(max(top // self.piece_h, 0), self.grid_rows - 1),
+                min(max((left + rect.width - 1) // self.piece_w, 0), self.grid_cols - 1),
+                min(max((top + rect.height - 1) // self.piece_h, 0), self.grid_rows - 1))
+
+    def update_cells(self, piece):
+        """块移动后更新它在空间网格中的登记；单元范围没变（大多数拖动帧）时什么都不做"""
+        cells = self.cell_range(piece.rect)
+        if cells == piece.cells:
+            return
+        if piece.cells is not None:
+            self._register(piece, piece.cells, False)
+        self._register(piece, cells, True)
+        piece.cells = cells
+
+    def _register(self, piece, cells, add):
+        x0, y0, x1, y1 = cells
+        for y in range(y0, y1 + 1):
+            row = y * self.grid_cols
+            for x in range(x0, x1 + 1):
+                if add:
+                    self.cells[row + x].add(piece)
+                else:
+                    self.cells[row + x].discard(piece)
+
+    def pick(self, pos):
+        """返回 pos 处最上层的拼图块，没有时返回 None"""
+        if not self.bounds.collidepoint(pos):
+            return None
+        x = (pos[0] - self.bounds.left) // self.piece_w
+        y = (pos[1] - self.bounds.top) // self.piece_h
+        best = None
+        for piece in self.cells[y * self.grid_cols + x]:
+            if piece.rect.collidepoint(pos) and (best is None or piece.z > best.z):
+                # 异形块的矩形四角是透明的，按形状遮罩判断
+                if piece.mask is None or piece.mask.get_at((pos[0] - piece.rect.x, pos[1] - piece.rect.y)):
+                    best = piece
+        return best
+
+    def raise_piece(self, piece):
+        """把块移到最上层"""
+        self._z += 1
+        piece.z = self._z
+        self.order[piece.index] = piece
+        self.order.move_to_end(piece.index)
+
+    def move(self, piece, topleft):
+        piece.rect.topleft = topleft
+        self.update_cells(piece)
+
+    def drop(self, piece):
+        """松开拖动的块：中心落在自己的格子里且离正确位置足够近时吸附，返回是否吸附"""
+        was_correct = piece.correct
+        snapped = False
+        if self.slot_at(piece.rect.center) == piece.index:
+            dx = piece.rect.x - piece.target[0]
+            dy = piece.rect.y - piece.target[1]
+            snapped = dx * dx + dy * dy < self.snap_distance * self.snap_distance
+        if snapped:
+            self.move(piece, piece.target)
+        piece.correct = snapped
+        self.correct_count += snapped - was_correct
+        return snapped
+
+    def slot_at(self, pos):
+        """pos 所在的拼图区域格子序号，不在拼图区域内时返回 None"""
+        if not self.area.collidepoint(pos):
+            return None
+        return ((pos[1] - self.area.top) // self.piece_h * self.cols
+                + (pos[0] - self.area.left) // self.piece_w)
+
+    def is_complete(self):
+        return self.correct_count == len(self.pieces)
+
+    def pieces_in(self, rect):
+        """与 rect 相交的块，按层级从下到上；整屏重绘时直接遍历 order"""
+        x0, y0, x1, y1 = self.cell_range(rect)
+        found = set()
+        for y in range(y0, y1 + 1):
+            row = y * self.grid_cols
+            for x in range(x0, x1 + 1):
+                found.update(self.cells[row + x])
+        return sorted((piece for piece in found if piece.rect.colliderect(rect)), key=lambda piece: piece.z)
+
 
 class PuzzleScene(Scene):
-    def __init__(self, game):
+    image_path = "assets/fengjing2.jpg"
+    # 拖动拼图需要松开和移动事件
+    input_events = (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION)
+    
+    def __init__(self, game, node):
         print("PuzzleScene initialized")
-        super().__init__(game)
+        super().__init__(game, node)
         
         # 首先初始化基本变量，避免出现属性未定义的情况
         self.dragging = None
         self.drag_offset = (0, 0)
-        self.pieces = []
-        self.completed = False
-        self.show_complete_message = False
-        self.complete_alpha = 0
+        self.board = None
         self.complete_text = "恭喜完成! 点击继续..."
+        # 完成消息的半透明底板，创建一次每帧只改透明度
+        self.message_bg = pygame.Surface((800, 100))
+        self.message_bg.fill((255, 255, 255))
+        self.static_layer = None
+        # 完成消息（半透明底、文字和点击提示）所在区域
+        self.message_rect = pygame.Rect(0, 450, 800, 110)
         
         try:
             self.title_text = "拼图游戏"
             self.instruction_text = "拖动拼图块完成拼图"
             
-            # 加载原始图片
-            self.original_image = pygame.image.load("assets/fengjing2.jpg")
+            # 拼图图片、区域大小、行列数和块形状来自场景图节点，默认 300x300 的 3x3 矩形拼图
+            size = self.puzzle_size(node)
+            rows = node.params.get('rows', 3)
+            cols = node.params.get('cols', 3)
             
-            # 创建参考图像（缩小版）
-            self.reference_image = pygame.transform.scale(self.original_image, (300, 300))
+            # 加载原始图片（已缩放到拼图区域大小）；参考图像合成进静态图层，
+            # 矩形拼图块是它的子 Surface，异形拼图块在图集里，场景本身不再持有原图
+            image = self.game.assets.get_image(node.params.get('image', self.image_path), size)
             
-            # 设置拼图区域
-            self.game_area = pygame.Rect(450, 150, 300, 300)
+            # 参考图像在左半屏、拼图区域在右半屏，各自水平居中
+            self.reference_pos = (200 - size[0] // 2, 150)
+            self.board = PuzzleBoard(image, (600 - size[0] // 2, 150), rows, cols,
+                                     self.screen.get_rect(), shape=node.params.get('shape', 'rect'))
+            self.game_area = self.board.area
+            self.pieces = self.board.pieces
             
-            # 计算每个拼图块的大小
-            self.grid_size = 100  # 300/3 = 100
-            
-            # 创建拼图块
-            self.create_pieces()
+            # 静态图层：底色、标题、说明、参考图像和拼图区域边框
+            self.static_layer = self.bake_static_layer(image)
             
         except Exception as e:
             print(f"Error in PuzzleScene initialization: {e}")      
-    def create_pieces(self):
-        # 确保原始图片已经缩放到正确大小
-        self.original_image = pygame.transform.scale(self.original_image, (300, 300))
-        
+    def enter(self):
+        super().enter()
+        self.dragging = None
+        self.completed = False
+        self.show_complete_message = False
+        self.complete_alpha = 0
+        if self.board is None:
+            # 拼图初始化失败（图片或尺寸配置有误）时跳过本场景，和视频加载失败的处理相同
+            self.go_next()
+            return
+        self.shuffle_pieces()
+
+    @staticmethod
+    def puzzle_size(node):
+        size = node.params.get('size', 300)
+        return (size, size)
+
+    @classmethod
+    def required_assets(cls, game, node):
+        return [('image', node.params.get('image', cls.image_path), cls.puzzle_size(node), None)]
+
+    def bake_static_layer(self, reference_image):
+        key = ('layer', self.node.id)
+        surface = self.game.assets.get_cached(key)
+        if surface is None:
+            surface = self.bake_layer([
+                (self.render_text(self.title_text, (0, 0, 0)), (20, 20)),
+                (self.render_text(self.instruction_text, (100, 100, 100)), (20, 60)),
+                (reference_image, self.reference_pos),
+            ], fill=(240, 240, 240))
+            pygame.draw.rect(surface, (100, 100, 100), self.game_area, 2)
+            self.game.assets.store(key, surface)
+        return surface
+
+    def shuffle_pieces(self):
         # 打乱拼图块的初始位置
-        positions = [(x, y) for x in range(3) for y in range(3)]
-        random.shuffle(positions)
-        
-        for i, (grid_x, grid_y) in enumerate(positions):
-            # 计算原始图片中的裁剪位置
-            orig_x = (i % 3) * self.grid_size
-            orig_y = (i // 3) * self.grid_size
-            
-            # 计算目标位置（正确位置）
-            target_x = self.game_area.left + (i % 3) * self.grid_size
-            target_y = self.game_area.top + (i // 3) * self.grid_size
-            
-            # 创建拼图块表面并从原图中裁剪对应区域
-            piece_surface = pygame.Surface((self.grid_size, self.grid_size))
-            piece_rect = pygame.Rect(orig_x, orig_y, self.grid_size, self.grid_size)
-            piece_surface.blit(self.original_image, (0, 0), piece_rect)
-            
-            # 计算初始位置（打乱的位置）
-            initial_x = self.game_area.left + grid_x * self.grid_size
-            initial_y = self.game_area.top + grid_y * self.grid_size
-            
-            # 创建拼图块对象
-            self.pieces.append({
-                'surface': piece_surface,
-                'rect': pygame.Rect(initial_x, initial_y, self.grid_size, self.grid_size),
-                'target': (target_x, target_y),
-                'correct': False,
-                'index': i
-            })
-            print(f"Created piece {i}: target={target_x},{target_y}, initial={initial_x},{initial_y}")
+        self.board.shuffle()
+        print(f"Shuffled {len(self.pieces)} pieces ({self.board.rows}x{self.board.cols}), "
+              f"{self.board.correct_count} already in place")
+
     def handle_events(self, events):
+        if self.board is None:
+            return
         for event in events:
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 # 检查是否完成拼图并点击继续
                 if self.show_complete_message and self.complete_alpha >= 255:
                     if self.can_handle_click():
-                        print("Creating VideoScene")
-                        self.next_scene = VideoScene(self.game)
+                        self.go_next()
                         return
                 
-                # 拼图拖动逻辑
+                # 拼图拖动逻辑：只检查鼠标所在网格单元里的块
                 mouse_pos = event.pos
-                for piece in self.pieces:
-                    if piece['rect'].collidepoint(mouse_pos):
-                        self.dragging = piece
-                        self.drag_offset = (
-                            piece['rect'].x - mouse_pos[0],
-                            piece['rect'].y - mouse_pos[1]
-                        )
-                        # 将当前拖拽的块移到最上层
-                        self.pieces.remove(piece)
-                        self.pieces.append(piece)
-                        break
+                piece = self.board.pick(mouse_pos)
+                if piece is not None:
+                    self.dragging = piece
+                    self.drag_offset = (
+                        piece.rect.x - mouse_pos[0],
+                        piece.rect.y - mouse_pos[1]
+                    )
+                    # 将当前拖拽的块移到最上层
+                    self.board.raise_piece(piece)
+                    self.mark_dirty(piece.rect)
                         
             elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
                 if self.dragging:
-                    # 检查是否放在正确位置
-                    piece_center = self.dragging['rect'].center
-                    target_pos = self.dragging['target']
-                    target_center = (
-                        target_pos[0] + self.grid_size/2,
-                        target_pos[1] + self.grid_size/2
-                    )
-                    
-                    # 改进的吸附判断逻辑
-                    distance = math.sqrt(
-                        (piece_center[0] - target_center[0])**2 +
-                        (piece_center[1] - target_center[1])**2
-                    )
-                    
-                    if distance < 50:  # 吸附距离阈值
-                        # 吸附到正确位置
-                        self.dragging['rect'].topleft = target_pos
-                        self.dragging['correct'] = True
-                        print(f"Piece {self.dragging['index']} snapped to position {target_pos}")
+                    piece = self.dragging
+                    self.mark_dirty(piece.rect)
+                    # 检查是否放在正确位置，足够近时吸附
+                    if self.board.drop(piece):
+                        self.mark_dirty(piece.rect)
+                        print(f"Piece {piece.index} snapped to position {piece.target}")
                         
                         # 立即检查是否完成拼图
                         if self.check_completion():
                             print("Puzzle completed!")
                             self.show_complete_message = True
-                            self.complete_alpha = 0  # 确保从0开始淡入
+                            self.timeline.to(self, 'complete_alpha', 255, 0.85, start=0)  # 从0开始淡入
                     else:
-                        self.dragging['correct'] = False
-                        print(f"Piece not in correct position. Distance: {distance}")
+                        print(f"Piece not in correct position: {piece.rect.topleft}, target {piece.target}")
                     
                     self.dragging = None
                     
             elif event.type == pygame.MOUSEMOTION:
                 if self.dragging:
                     mouse_pos = event.pos
-                    self.dragging['rect'].x = mouse_pos[0] + self.drag_offset[0]
-                    self.dragging['rect'].y = mouse_pos[1] + self.drag_offset[1]
+                    # 旧位置和新位置都需要重绘
+                    self.mark_dirty(self.dragging.rect)
+                    self.board.move(self.dragging, (mouse_pos[0] + self.drag_offset[0],
+                                                    mouse_pos[1] + self.drag_offset[1]))
+                    self.mark_dirty(self.dragging.rect)
                     
     def update(self):
-        # 更新完成消息的淡入效果
-        if self.show_complete_message and self.complete_alpha < 255:
-            self.complete_alpha = min(255, self.complete_alpha + 5)
+        if self.board is None:
+            return
+        # 完成消息淡入期间重绘消息区域
+        if self.timeline.changed:
+            self.mark_dirty(self.message_rect)
         
         super().update()
+
+    def is_animating(self):
+        return self.dragging is not None or self.timeline.busy
         
     def check_completion(self):
-        all_correct = True
-        incorrect_pieces = []
-        for i, piece in enumerate(self.pieces):
-            # 检查位置是否正确
-            current_pos = piece['rect'].topleft
-            target_pos = piece['target']
-            if abs(current_pos[0] - target_pos[0]) > 5 or abs(current_pos[1] - target_pos[1]) > 5:
-                all_correct = False
-                incorrect_pieces.append(i)
-                piece['correct'] = False
-            else:
-                piece['correct'] = True
-        
-        if not all_correct:
-            print(f"Puzzle not complete. Incorrect pieces: {incorrect_pieces}")
-        else:
+        # 拼好的块数在吸附时增减，不必逐块检查
+        if self.board.is_complete():
             print("All pieces in correct position!")
             self.completed = True
-        
-        return all_correct
+            return True
+        print(f"Puzzle not complete: {self.board.correct_count}/{len(self.pieces)} pieces in place")
+        return False
         
     def draw(self):
+        if self.board is None:
+            return
         try:
-            # 清空屏幕并设置背景色
-            self.screen.fill((240, 240, 240))
-            
-            # 绘制标题
-            title_surface = self.font.render(self.title_text, True, (0, 0, 0))
-            self.screen.blit(title_surface, (20, 20))
-            
-            # 绘制说明
-            instruction_surface = self.font.render(self.instruction_text, True, (100, 100, 100))
-            self.screen.blit(instruction_surface, (20, 60))
-            
-            # 绘制参考图像
-            self.screen.blit(self.reference_image, (50, 150))
-            
-            # 绘制拼图区域边框
-            pygame.draw.rect(self.screen, (100, 100, 100), self.game_area, 2)
+            # 底色、标题、说明、参考图像和边框已合成为静态图层
+            self.screen.blit(self.static_layer, (0, 0))
             
-            # 绘制拼图块
-            for piece in self.pieces:
-                self.screen.blit(piece['surface'], piece['rect'])
+            # 绘制拼图块；局部重绘时只画与重绘区域相交的块
+            clip = self.screen.get_clip()
+            if clip == self.screen.get_rect():
+                pieces = self.board.order.values()
+            else:
+                pieces = self.board.pieces_in(clip)
+            for piece in pieces:
+                self.board.draw_piece(self.screen, piece)
             
             # 绘制完成消息
             if self.show_complete_message:
-                # 创建半透明背景
-                overlay = pygame.Surface((800, 100))
-                overlay.fill((255, 255, 255))
-                overlay.set_alpha(min(200, self.complete_alpha))
-                overlay_rect = overlay.get_rect(center=(400, 500))
-                self.screen.blit(overlay, overlay_rect)
+                # 半透明背景
+                self.message_bg.set_alpha(min(200, self.complete_alpha))
+                overlay_rect = self.message_bg.get_rect(center=(400, 500))
+                self.screen.blit(self.message_bg, overlay_rect)
                 
                 # 绘制完成消息
-                complete_surface = self.font.render(self.complete_text, True, (0, 150, 0))
-                complete_surface.set_alpha(self.complete_alpha)
+                complete_surface = self.render_text(self.complete_text, (0, 150, 0), self.complete_alpha)
                 complete_rect = complete_surface.get_rect(center=(400, 500))
                 self.screen.blit(complete_surface, complete_rect)
                 
                 # 添加点击提示
                 if self.complete_alpha >= 255:
-                    hint_surface = self.font.render("点击继续...", True, (100, 100, 100))
+                    hint_surface = self.render_text("点击继续...", (100, 100, 100))
                     hint_rect = hint_surface.get_rect(center=(400, 540))
                     self.screen.blit(hint_surface, hint_rect)
             
-            pygame.display.flip()
-            
         except Exception as e:
             print(f"Error in PuzzleScene draw: {e}")
             
     def cleanup(self):
         """清理场景特定的资源"""
-        if hasattr(self, 'original_image'):
-            self.original_image = None
-        if hasattr(self, 'reference_image'):
-            self.reference_image = None
-        if hasattr(self, 'pieces'):
-            self.pieces = []
-        gc.collect()
+        self.board = None
+        self.pieces = []
+        self.static_layer = None
                    
 class VideoScene(Scene):
-    def __init__(self, game):
-        super().__init__(game)
-        self.video_path = "assets/video.mp4"
+    video_path = "assets/video.mp4"
+    video_size = (700, 394)
+    
+    def __init__(self, game, node):
+        super().__init__(game, node)
         
         # 初始化默认属性
         self.is_playing = False
-        self.frame_iterator = None
+        self.decoder = None
+        self.pending_frame = None
+        # 正在显示的帧槽，换帧时还给解码线程
+        self.frame_slot = None
         self.frame_surface = None
         self.video = None
-        self.frame_index = 0
-        self.current_time = 0
         
         # 初始化标题背景和其他UI元素
         self.title_bg = pygame.Surface((800, 80))
@@ -709,45 +2508,21 @@ class VideoScene(Scene):
                 print(f"错误：视频文件不存在: {self.video_path}")
                 raise FileNotFoundError(f"视频文件不存在: {self.video_path}")
             
-            # 处理 PIL.Image 版本兼容性
-            from PIL import Image
-            if hasattr(Image, 'Resampling'):
-                resize_method = Image.Resampling.LANCZOS
-            else:
-                resize_method = Image.LANCZOS
-            
-            print("开始加载VideoFileClip...")
-            self.video = VideoFileClip(self.video_path, audio=False)
-            print("VideoFileClip加载成功")
+            # 有按显示尺寸转码好的副本时直接播放副本，不再逐帧缩放
+            self.play_path = None
+            self.load_video(VideoTranscodeCache.resolve(self.video_path, self.video_size))
             
             self.title_text = "数字园林简介"
             self.subtitle_text = "探索传统与科技的完美融合"
             
-            self.video_size = (700, 394)
-            self.video_pos = ((800 - self.video_size[0]) // 2, 100)
-            
-            # 使用新的缩放方法
-            def resize_with_lanczos(clip, newsize):
-                from PIL import Image
-                import numpy as np
-                
-                def resize_frame(frame):
-                    img = Image.fromarray(frame)
-                    img = img.resize(newsize, resize_method)
-                    return np.array(img)
-                
-                return clip.fl_image(resize_frame)
-            
-            # 应用新的缩放方法
-            self.video = resize_with_lanczos(self.video, self.video_size)
-            self.frame_iterator = self.video.iter_frames()
+            # 静态图层：黑色底、标题栏和标题文字（视频画面在标题栏下方，不重叠）
+            self.static_layer = self.bake_layer([
+                (self.title_bg, (0, 0)),
+                (self.render_text(self.title_text, (255, 255, 255)), (20, 20)),
+                (self.render_text(self.subtitle_text, (200, 200, 200)), (20, 50)),
+            ], fill=(0, 0, 0), key=('layer', 'VideoScene'))
             
-            # 设置播放控制
-            self.is_playing = True
-            self.frame_index = 0
-            self.current_time = 0
-            self.duration = self.video.duration * 1000
-            self.total_frames = int(self.video.duration * self.video.fps)
+            self.video_pos = ((800 - self.video_size[0]) // 2, 100)
             
             # 进度条设置
             self.progress_rect = pygame.Rect(50, 520, 700, 10)
@@ -757,11 +2532,9 @@ class VideoScene(Scene):
             self.skip_text = "点击跳过 >>"
             self.skip_alpha = 128
             
-            # 帧率控制
-            self.target_fps = self.video.fps
-            self.frame_time = 1.0 / self.target_fps
-            self.accumulated_time = 0
-            self.last_frame_time = pygame.time.get_ticks() / 1000.0
+            # 每帧变化的区域：视频画面、进度条、闪烁的跳过提示
+            self.video_rect = pygame.Rect(self.video_pos, self.video_size)
+            self.skip_rect = pygame.Rect((700, 550), self.font.size(self.skip_text))
             
             print("视频初始化完成")
             
@@ -771,8 +2544,82 @@ class VideoScene(Scene):
             import traceback
             print("详细错误信息:")
             traceback.print_exc()
-            # 如果视频加载失败，跳转到感谢场景
-            self.next_scene = ThankScene(game)
+            self.video = None
+    
+    def load_video(self, path):
+        """打开要播放的视频，换掉之前持有的；优先使用预取线程提前打开的"""
+        video = self.game.preloader.take_video(path)
+        if video is None:
+            print("开始加载VideoFileClip...")
+            video = open_video_clip(path)
+        print(f"VideoFileClip加载成功: {path}")
+        if self.video is not None:
+            self.video.close()
+        self.video = video
+        self.play_path = path
+        self.duration = video.duration * 1000
+        self.total_frames = int(video.duration * video.fps)
+        self.target_fps = video.fps
+    
+    def enter(self):
+        super().enter()
+        if self.video:
+            # 场景对象在场景池里复用：上次访问之后后台转码完成时，改为播放转码好的副本
+            play_path = VideoTranscodeCache.resolve(self.video_path, self.video_size)
+            if play_path != self.play_path:
+                try:
+                    self.load_video(play_path)
+                except Exception as e:
+                    print(f"切换到转码副本失败，继续播放 {self.play_path}: {e}")
+        if not self.video:
+            # 如果视频加载失败，直接进入下一个场景
+            self.go_next()
+            return
+        
+        # 设置播放控制
+        self.is_playing = True
+        self.frame_index = 0
+        self.current_time = 0
+        self.pending_frame = None
+        # 跳转后等待第一帧期间暂停展示时钟，保证跳转目标帧能显示出来
+        self.seeking = False
+        self.frame_slot = None
+        self.frame_surface = None
+        self.skip_alpha = 128
+        
+        # 解码和 LANCZOS 缩放都在后台线程和 ffmpeg 中进行；关键帧索引供进度条跳转使用。
+        # 解码线程和帧槽只在播放期间存在，离开场景时释放
+        self.decoder = VideoDecoder(self.video, self.video_size, self.total_frames,
+                                    keyframes=KeyframeIndex.for_video(self.play_path)).start()
+        
+        # 帧率控制：展示时钟（秒），决定当前应显示哪一帧
+        self.play_time = 0
+        self.last_frame_time = pygame.time.get_ticks() / 1000.0
+    
+    def exit(self):
+        """停止解码线程，归还帧槽"""
+        self.is_playing = False
+        if self.decoder:
+            self.decoder.stop()
+            self.decoder = None
+        self.pending_frame = None
+        self.frame_slot = None
+        self.frame_surface = None
+
+    @classmethod
+    def required_assets(cls, game, node):
+        path = VideoTranscodeCache.resolve(cls.video_path, cls.video_size)
+        # 场景池里的场景已经打开了同一个文件时不再预取，否则没人取走的视频连同 ffmpeg 进程一直留在预取线程里
+        scene = game.scenes.get(node.id) if game is not None else None
+        if scene is not None and scene.video is not None and scene.play_path == path:
+            return []
+        return [('video', path, None, None)]
+
+    @classmethod
+    def bundle_assets(cls, node):
+        # 视频不进图片包，也不要为此触发转码
+        return []
+
     def handle_events(self, events):
         for event in events:
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
@@ -784,8 +2631,7 @@ class VideoScene(Scene):
                 # 检查跳过按钮点击
                 skip_rect = pygame.Rect(650, 530, 130, 50)
                 if skip_rect.collidepoint(mouse_pos):
-                    self.cleanup()
-                    self.next_scene = ThankScene(self.game)
+                    self.go_next()
                     return
                 
                 # 进度条点击不需要延迟
@@ -797,17 +2643,18 @@ class VideoScene(Scene):
         try:
             # 计算新的进度
             progress = (x_pos - self.progress_rect.left) / self.progress_rect.width
-            self.frame_index = int(progress * self.total_frames)
             
-            # 重新加载视频
+            # 由解码线程跳转到点击的那一帧：ffmpeg 从之前最近的关键帧解码过去，
+            # 不对齐到关键帧，源视频关键帧间隔约 3 秒，对齐会偏离点击位置最多 1.5 秒
+            self.frame_index = self.decoder.seek(int(progress * self.total_frames), precise=True)
             start_time = self.frame_index / self.video.fps
-            self.video.close()  # 先关闭当前视频
-            self.video = VideoFileClip(self.video_path, audio=False)
-            self.video = self.video.resize(self.video_size)
-            self.video = self.video.subclip(start_time)
-            self.frame_iterator = self.video.iter_frames()
+            if self.pending_frame:
+                self.decoder.release(self.pending_frame[1])
+            self.pending_frame = None
+            self.seeking = True
             self.current_time = start_time * 1000
-            self.accumulated_time = 0
+            self.mark_dirty(self.progress_rect)
+            self.play_time = start_time
             self.last_frame_time = pygame.time.get_ticks() / 1000.0
         except Exception as e:
             print(f"视频进度调整错误: {e}")
@@ -816,47 +2663,68 @@ class VideoScene(Scene):
         if not hasattr(self, 'video') or not self.video:
             return
             
-        if self.is_playing and hasattr(self, 'frame_iterator') and self.frame_iterator:
+        if self.is_playing and self.decoder:
             current_time = pygame.time.get_ticks() / 1000.0
             delta_time = current_time - self.last_frame_time
             self.last_frame_time = current_time
             
-            self.accumulated_time += delta_time
+            if not self.seeking:
+                self.play_time += delta_time
+            target_index = int(self.play_time * self.target_fps)
+            self.decoder.target_index = target_index
             
-            while self.accumulated_time >= self.frame_time:
-                try:
-                    frame = next(self.frame_iterator)
-                    frame_surface = pygame.surfarray.make_surface(frame.swapaxes(0, 1))
-                    self.frame_surface = frame_surface
-                    self.frame_index += 1
-                    self.current_time = (self.frame_index / self.video.fps) * 1000
-                    self.accumulated_time -= self.frame_time
-                except StopIteration:
+            # 取出所有已到显示时间的帧，只保留最新的一帧；队列为空时不等待
+            while True:
+                if self.pending_frame is None:
+                    try:
+                        self.pending_frame = self.decoder.get_nowait()
+                    except queue.Empty:
+                        break
+                
+                if self.pending_frame is VideoDecoder.END:
                     self.is_playing = False
-                    self.cleanup()
-                    self.next_scene = ThankScene(self.game)
+                    self.go_next()
+                    return
+                
+                index, slot = self.pending_frame
+                if index > target_index:
                     break
+                self.pending_frame = None
+                self.seeking = False
+                # 帧数据已经在帧槽共享的 Surface 里，换上新槽、归还旧槽即可
+                self.decoder.release(self.frame_slot)
+                self.frame_slot = slot
+                self.frame_surface = self.decoder.surface(slot)
+                # 显示帧号加一，与原先“已播放帧数”的进度含义一致
+                self.frame_index = index + 1
+                self.current_time = (self.frame_index / self.video.fps) * 1000
+                self.mark_dirty(self.video_rect)
+                self.mark_dirty(self.progress_rect)
             
             # 闪烁跳过提示
-            self.skip_alpha = 128 + int(127 * math.sin(pygame.time.get_ticks() / 500))
+            self.skip_alpha = 128 + int(127 * math.sin(self.timeline.time * 2))
+            self.mark_dirty(self.skip_rect)
+
+    def is_animating(self):
+        return self.is_playing
+    
+    def profile_stats(self):
+        if not self.decoder:
+            return []
+        return [f"video queue {self.decoder.queue_depth()}/{self.decoder.queue_size}  "
+                f"decoded {self.decoder.decoded}  dropped {self.decoder.dropped}"]
+    
     def draw(self):
         if not hasattr(self, 'video') or not self.video:
             return
             
-        # 填充黑色背景
-        self.screen.fill((0, 0, 0))
+        # 黑色背景、标题栏和标题
+        self.screen.blit(self.static_layer, (0, 0))
         
         # 绘制视频帧
         if self.frame_surface:
             self.screen.blit(self.frame_surface, self.video_pos)
         
-        # 绘制标题背景和标题
-        self.screen.blit(self.title_bg, (0, 0))
-        title_surface = self.font.render(self.title_text, True, (255, 255, 255))
-        subtitle_surface = self.font.render(self.subtitle_text, True, (200, 200, 200))
-        self.screen.blit(title_surface, (20, 20))
-        self.screen.blit(subtitle_surface, (20, 50))
-        
         # 绘制进度条
         pygame.draw.rect(self.screen, (100, 100, 100), self.progress_rect)
         if self.duration > 0:
@@ -867,11 +2735,11 @@ class VideoScene(Scene):
                             progress_width, self.progress_rect.height))
         
         # 绘制跳过提示
-        skip_surface = self.font.render(self.skip_text, True, (255, 255, 255))
-        skip_surface.set_alpha(self.skip_alpha)
+        skip_surface = self.render_text(self.skip_text, (255, 255, 255), self.skip_alpha)
         self.screen.blit(skip_surface, (700, 550))
     def cleanup(self):
         """清理视频资源"""
+        self.exit()
         if hasattr(self, 'video') and self.video:
             try:
                 self.video.close()
@@ -879,106 +2747,313 @@ class VideoScene(Scene):
                 pass
             self.video = None
         
-        self.frame_iterator = None
         self.frame_surface = None
 
 # 重新设计 ThankScene
 class ThankScene(Scene):
-    def __init__(self, game):
-        super().__init__(game)
+    def __init__(self, game, node):
+        super().__init__(game, node)
         self.title_text = "感谢观看"
         self.messages = [
             "感谢您观看数字园林",
             "让我们一起探索传统与科技的完美融合",
             "开启智慧园林新时代"
         ]
+        if self.game.kiosk:
+            self.continue_text = "点击任意处重新开始"
+            self.hint_text = "即将回到首页..."
+        else:
+            self.continue_text = "点击任意处结束程序"
+            self.hint_text = "程序即将结束..."
+        # 文字淡入时长（秒）
+        self.fade_duration = 1.4
+        
+        # 闪烁提示（继续提示和结束提示）所在区域
+        continue_rect = pygame.Rect((0, 0), self.font.size(self.continue_text))
+        continue_rect.center = (400, 500)
+        hint_rect = pygame.Rect((0, 0), self.font.size(self.hint_text))
+        hint_rect.center = (400, 550)
+        self.blink_rect = continue_rect.union(hint_rect)
+        
+        # 背景与渐变合成为一张静态图层，之后的会话直接复用
+        self.static_layer = self.game.assets.get_cached(('layer', 'ThankScene'))
+        if self.static_layer is None:
+            self.static_layer = self.bake_background()
+    
+    def enter(self):
+        super().enter()
         self.show_continue = True
-        self.continue_text = "点击任意处结束程序"
-        self.alpha = 0
-        self.fade_speed = 3
-        
-        # 优雅的背景色
-        self.bg = pygame.Surface((800, 600))
-        self.bg.fill((245, 245, 240))  # 淡米色背景
-        
+        self.timeline.to(self, 'alpha', 255, self.fade_duration, start=0)
+    
+    def bake_background(self):
         # 添加柔和的渐变效果
-        self.gradient = pygame.Surface((800, 600), pygame.SRCALPHA)
+        gradient = pygame.Surface((800, 600), pygame.SRCALPHA)
         for i in range(600):
             alpha = int(100 * (1 - i/600))  # 减小渐变强度
-            pygame.draw.line(self.gradient, (220, 220, 215, alpha), (0, i), (800, i))
+            pygame.draw.line(gradient, (220, 220, 215, alpha), (0, i), (800, i))
+        
+        # 优雅的背景色：淡米色
+        return self.bake_layer([(gradient, (0, 0))], fill=(245, 245, 240), key=('layer', 'ThankScene'))
     
     def draw(self):
         # 绘制背景
-        self.screen.blit(self.bg, (0, 0))
-        self.screen.blit(self.gradient, (0, 0))
+        self.screen.blit(self.static_layer, (0, 0))
         
         # 绘制标题
-        title_surface = self.font.render(self.title_text, True, (70, 70, 70))
+        title_surface = self.render_text(self.title_text, (70, 70, 70), self.alpha)
         title_rect = title_surface.get_rect(center=(400, 150))
-        title_surface.set_alpha(self.alpha)
         self.screen.blit(title_surface, title_rect)
         
         # 绘制息
         for i, message in enumerate(self.messages):
-            msg_surface = self.font.render(message, True, (100, 100, 100))
+            msg_surface = self.render_text(message, (100, 100, 100), self.alpha)
             msg_rect = msg_surface.get_rect(center=(400, 250 + i * 50))
-            msg_surface.set_alpha(self.alpha)
             self.screen.blit(msg_surface, msg_rect)
         
         # 绘制继续提示（修复这里）
         if self.show_continue and self.alpha >= 255:
-            continue_surface = self.font.render(self.continue_text, True, (150, 150, 150))
+            continue_surface = self.render_text(self.continue_text, (150, 150, 150))
             continue_rect = continue_surface.get_rect(center=(400, 500))
             self.screen.blit(continue_surface, continue_rect)  # 添加这行
             
             # 添加额外的提示
-            hint_surface = self.font.render("程序即将结束...", True, (150, 150, 150))
+            hint_surface = self.render_text(self.hint_text, (150, 150, 150))
             hint_rect = hint_surface.get_rect(center=(400, 550))
             self.screen.blit(hint_surface, hint_rect)
 
     def update(self):
-        if self.alpha < 255:
-            self.alpha = min(255, self.alpha + self.fade_speed)
+        if self.timeline.changed:
+            self.mark_dirty()
         
         # 闪烁继续提示
-        if pygame.time.get_ticks() % 1000 < 500:
-            self.show_continue = True
-        else:
-            self.show_continue = False
+        show_continue = self.timeline.time % 1.0 < 0.5
+        if show_continue != self.show_continue:
+            self.mark_dirty(self.blink_rect)
+        self.show_continue = show_continue
+
+    def is_animating(self):
+        # 淡入结束后只剩每半秒一次的闪烁，空闲帧率足够
+        return self.timeline.busy
     
 
     def handle_events(self, events):
         for event in events:
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 if self.alpha >= 255 and self.can_handle_click():
-                    pygame.quit()
-                    sys.exit()
+                    if self.game.kiosk:
+                        # 展台模式：回到首页迎接下一位游客
+                        self.game.restart()
+                        return
+                    # 结束主循环，由主程序统一清理（停止解码线程、预取线程和音频）后退出
+                    self.game.running = False
+                    return
                 
+class SceneNode:
+    """场景图中的一个节点：场景 id、场景类、下一个场景的 id 和场景内容参数"""
+    def __init__(self, id, scene_class, next, params):
+        self.id = id
+        self.scene_class = scene_class
+        self.next = next
+        self.params = params
+
+
+class SceneGraph:
+    """场景图：从数据文件读入场景流程和题目、介绍等内容，每个文件在进程内只解析一次
+    
+    数据文件是 JSON：{"start": 起始场景 id, "scenes": [{"id", "type", "next", 内容参数...}]}，
+    type 为场景类名；问答节点按出现顺序编号 (params['number'])
+    """
+    _graphs = {}    # 文件路径 -> SceneGraph
+    
+    @classmethod
+    def load(cls, path):
+        path = os.path.normpath(path)
+        graph = cls._graphs.get(path)
+        if graph is None:
+            graph = cls._graphs[path] = cls(path)
+        return graph
+    
+    def __init__(self, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.path = path
+        self.start = data['start']
+        self.nodes = OrderedDict()
+        quiz_number = 0
+        for entry in data['scenes']:
+            params = dict(entry)
+            node_id = params.pop('id')
+            type_name = params.pop('type')
+            scene_class = Scene.types.get(type_name)
+            if scene_class is None:
+                raise ValueError(f"{path}: 场景 {node_id} 的类型未知: {type_name}")
+            if node_id in self.nodes:
+                raise ValueError(f"{path}: 场景 id 重复: {node_id}")
+            if scene_class is QuizScene:
+                quiz_number += 1
+                params['number'] = quiz_number
+            self.nodes[node_id] = SceneNode(node_id, scene_class, params.pop('next', None), params)
+        
+        for node in self.nodes.values():
+            if node.next is not None and node.next not in self.nodes:
+                raise ValueError(f"{path}: 场景 {node.id} 的下一个场景不存在: {node.next}")
+        if self.start not in self.nodes:
+            raise ValueError(f"{path}: 起始场景不存在: {self.start}")
+
+
 class Game:
-    def __init__(self):
-        pygame.init()
-        pygame.mixer.init()
+    def __init__(self, transparency='alpha', convert_images=True, dirty_rects=True, idle_fps=10,
+                 fast_start=False, profile_csv=None, profile_trace=None, scene_file=SCENE_FILE,
+                 kiosk=False, idle_timeout=90, asset_budget_mb=64, asset_bundle=BUNDLE_FILE,
+                 decode_workers=DECODE_WORKERS, coalesce_motion=True):
+        # 快速启动：只初始化显示和字体，音频、视频转码检查和预取推迟到第一帧显示之后
+        self.fast_start = fast_start
+        if fast_start:
+            pygame.display.init()
+            pygame.font.init()
+        else:
+            pygame.init()
+            pygame.mixer.init()
+        STARTUP.mark("pygame 初始化")
         
         self.screen = pygame.display.set_mode((800, 600))
         pygame.display.set_caption("数字江南·智慧苏州")
         self.clock = pygame.time.Clock()
+        STARTUP.mark("创建窗口")
         self.font = self.init_font(24)
         self.title_font = self.init_font(48)  # 添加大号字体
-        
-        # 添加问题序号初始化
-        self.current_question = 0
-        
-        # 加载并播放背景音乐
-        self.bg_music = pygame.mixer.Sound("assets/preview.mp3")
-        self.bg_music.set_volume(0.3)  # 设置音量为30%
-        self.bg_music.play(loops=-1)  # loops=-1表示无限循环
-        
-        self.current_scene = TitleScene(self)
-        # self.current_scene = VideoScene(self)
+        STARTUP.mark("加载字体")
+        
+        # 文字渲染缓存，所有场景共用
+        self.text = TextCache()
+        
+        # 进程级图片缓存，所有场景共用；像素内存超出预算时按 LRU 淘汰
+        self.assets = AssetCache(budget_bytes=int(asset_budget_mb * 2**20),
+                                 transparency=transparency, convert_images=convert_images)
+        self.assets.preloader = self.preloader = AssetPreloader(self.assets, workers=decode_workers)
+        # 有安装时生成的图片包就映射进来，包里的图片不再解码 JPEG；asset_bundle 为 None 时总是读原图
+        if asset_bundle:
+            self.assets.bundle = AssetBundle.open(asset_bundle)
+            STARTUP.mark("映射图片包")
+        # 背景图：各场景下一次访问要显示的背景在预取时就随机选定，进入场景时取走
+        self.background_paths = None
+        self.background_choices = {}
+        
+        # 场景切换耗时记录 (来源场景, 目标场景, 毫秒)，展台模式长时间运行只保留最近的
+        self.transition_latencies = deque(maxlen=1000)
+        # 切换耗时：从触发切换的事件处理开始，到新场景第一帧显示为止（不含帧间等待）
+        self.transition_start = None
+        self.transition_ms = 0
+        self.last_scene = None
+        self.running = False
+        # 展台模式：致谢页点击后或无人操作超过 idle_timeout 秒时回到首页，不退出进程，
+        # 缓存、场景池、音乐和已打开的视频都保留给下一位游客
+        self.kiosk = kiosk
+        self.idle_timeout = idle_timeout
+        self.last_input_time = time.perf_counter()
+        self.sessions = 0
+        
+        # 垃圾回收：启动完成后冻结启动期创建的对象，场景切换时不做整堆回收，
+        # 完整回收只在空闲帧里做，最多每 gc_interval 秒一次
+        self.gc_interval = 10.0
+        self.last_gc = time.perf_counter()
+        # 输入层：按场景过滤事件类型、合并鼠标移动事件，记录输入到画面的延迟
+        self.input = InputLayer(coalesce_motion=coalesce_motion)
+        # 分阶段帧耗时，F3 切换屏幕叠加显示
+        self.profiler = FrameProfiler(csv_path=profile_csv, trace_path=profile_trace)
+        self.fps = 60
+        self.frame_budget_ms = 1000 / self.fps
+        # 动画时钟（秒），场景的时间线按它推进；基准测试可以换成模拟时钟
+        self.time_source = time.perf_counter
+        
+        # 脏矩形渲染：只重绘、上传场景报告的变化区域
+        self.dirty_rects = dirty_rects
+        # 场景没有动画时的刷新率，有输入时立即唤醒
+        self.idle_fps = idle_fps
+        # 唤醒空闲等待的事件，排在下一帧取出的事件前面
+        self.pending_events = []
+        
+        self.music = None
+        # 场景流程和内容来自场景图数据文件，场景对象第一次进入时才创建，之后放在场景池里复用
+        self.graph = SceneGraph.load(scene_file)
+        self.scenes = {}
+        self.current_scene = self.scene(self.graph.start)
+        self.current_scene.enter()
+        self.input.set_scene(self.current_scene)
+        STARTUP.mark("创建标题场景")
+        if not fast_start:
+            self.start_background_work()
+    
+    def start_background_work(self):
+        """第一帧之外的初始化：音频、视频转码检查和下一场景的预取"""
+        if self.fast_start:
+            pygame.mixer.init()
+        # 背景音乐流式播放，音量30%
+        self.music = MusicPlayer(volume=0.3)
+        self.music.play(self.current_scene.music_path)
+        STARTUP.mark("初始化音频")
+        
+        # 视频按显示尺寸转码的副本不存在时，尽早在后台开始转码
+        VideoTranscodeCache.resolve(VideoScene.video_path, VideoScene.video_size)
+        self.current_scene.start_prefetch()
+        STARTUP.mark("开始转码检查和预取")
+
+    @staticmethod
+    def build_asset_bundle(scene_file=SCENE_FILE, path=BUNDLE_FILE, workers=DECODE_WORKERS):
+        """按场景图收集所有场景的图片，生成预缩放图片包（安装时运行，不需要显示窗口）"""
+        graph = SceneGraph.load(scene_file)
+        requests = []
+        for node in graph.nodes.values():
+            requests.extend(node.scene_class.bundle_assets(node))
+        start = time.perf_counter()
+        count = AssetBundle.build(requests, path, workers)
+        print(f"图片包已生成: {path}，{count} 张图片，{os.path.getsize(path) / 2**20:.1f} MB，"
+              f"耗时 {time.perf_counter() - start:.1f} 秒")
+        return path
+
+    def scene(self, node_id):
+        """取场景图中 node_id 对应的场景：已创建过的从场景池取出复用，否则创建"""
+        scene = self.scenes.get(node_id)
+        if scene is None:
+            node = self.graph.nodes[node_id]
+            scene = self.scenes[node_id] = node.scene_class(self, node)
+        return scene
+    
+    def choose_background(self, node_id):
+        """为场景下一次访问选定背景图路径；已选定还未取走时返回同一张"""
+        if node_id not in self.background_choices:
+            if self.background_paths is None:
+                self.background_paths = self.assets.list_images(BACKGROUND_DIR)
+            paths = self.background_paths
+            self.background_choices[node_id] = random.choice(paths) if paths else None
+        return self.background_choices[node_id]
+    
+    def take_background(self, node_id):
+        """取走选定的背景图路径，下次访问重新随机"""
+        path = self.choose_background(node_id)
+        del self.background_choices[node_id]
+        return path
+    
+    def restart(self):
+        """回到起始场景（展台循环时下一位游客开始），场景池和已合成的图层都保留"""
+        self.sessions += 1
+        self.current_scene.next_scene = self.scene(self.graph.start)
 
     def cleanup(self):
+        # 停止预取线程
+        self.preloader.stop()
+        # 释放场景池
+        self.current_scene.exit()
+        for scene in self.scenes.values():
+            scene.cleanup()
+        self.scenes.clear()
+        # 场景里停下的视频解码线程在后台关闭 ffmpeg，退出前等它们收尾
+        VideoDecoder.join_all()
+        # 还没完成的视频转码：结束 ffmpeg，删除临时文件和锁文件，下次启动重新转码
+        VideoTranscodeCache.abort()
         # 停止并释放音乐资源
-        self.bg_music.stop()
+        if self.music:
+            self.music.stop()
         pygame.mixer.quit()
         
     def init_font(self, size):
@@ -999,39 +3074,243 @@ class Game:
         return pygame.font.Font(None, size)
     
     def run(self):
-        running = True
-        last_scene = None
+        self.running = True
+        self.show_first_frame()
+        while self.running:
+            self.step(self.poll_events())
+            self.wait_next_frame()
+    
+    def show_first_frame(self):
+        """先显示第一帧，快速启动模式下再做其余的初始化"""
+        self.profiler.begin_frame()
+        self.render()
+        self.profiler.end_frame(self.current_scene.node.id)
+        STARTUP.frame_shown()
+        if self.music is None:
+            self.start_background_work()
+        # 启动期的模块、字体、缓存等对象会一直存在，移出分代回收，之后的回收不再扫描它们；
+        # 这里不先做整堆回收，它本身就要几十毫秒，会卡住第二帧
+        gc.freeze()
+        STARTUP.mark("冻结启动期对象")
+    
+    def step(self, events):
+        """处理一帧：场景切换、事件、更新和绘制，返回本帧的处理耗时（毫秒，不含帧间等待）"""
+        current_time = pygame.time.get_ticks()
+        frame_start = time.perf_counter()
+        profiler = self.profiler
+        profiler.begin_frame()
         
-        while running:
-            current_time = pygame.time.get_ticks()
-            events = pygame.event.get()
-            
-            for event in events:
-                if event.type == pygame.QUIT:
-                    running = False
-            
-            # 场景切换优化
-            if self.current_scene.next_scene:
-                print(f"Current scene: {type(self.current_scene).__name__}")
-                print(f"Next scene: {type(self.current_scene.next_scene).__name__}")
-                if last_scene != self.current_scene.next_scene:
-                    # 确保当前场景被清理
-                    self.current_scene.cleanup()
-                    # 清空屏幕
-                    self.screen.fill((255, 255, 255))
-                    pygame.display.flip()
-                    
-                    last_scene = self.current_scene
-                    self.current_scene = self.current_scene.next_scene
-                    self.current_scene.click_cooldown = current_time + 200
-                    print(f"Scene switched to {type(self.current_scene).__name__}")
+        # 把预取线程解码好的图片转成 Surface
+        self.preloader.collect()
+        self.music.update()
+        events = self.input.process(events, frame_start)
+        profiler.mark('collect')
+        
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle_overlay()
+                # 关闭时把叠加层盖住的区域重绘回来
+                self.current_scene.mark_dirty(profiler.overlay_rect)
+            if event.type in INPUT_EVENTS:
+                self.last_input_time = frame_start
+        
+        # 展台模式下游客离开（长时间无操作）时回到首页
+        if (self.kiosk and not self.current_scene.next_scene
+                and self.current_scene.node.id != self.graph.start
+                and frame_start - self.last_input_time > self.idle_timeout):
+            print(f"{self.idle_timeout} 秒无操作，回到首页")
+            self.restart()
+        
+        # 场景切换：离开当前场景、进入下一个场景，场景对象本身留在场景池里
+        if self.current_scene.next_scene:
+            print(f"Current scene: {self.current_scene.node.id}")
+            print(f"Next scene: {self.current_scene.next_scene.node.id}")
+            self.current_scene.exit()
+            # 清空屏幕
+            self.screen.fill((255, 255, 255))
+            pygame.display.flip()
             
-            self.current_scene.handle_events(events)
-            self.current_scene.update()
+            self.last_scene = self.current_scene
+            self.current_scene = self.current_scene.next_scene
+            self.current_scene.enter()
+            self.input.set_scene(self.current_scene)
+            self.current_scene.click_cooldown = current_time + 200
+            self.current_scene.start_prefetch()
+            self.music.play(self.current_scene.music_path)
+            print(f"Scene switched to {self.current_scene.node.id}")
+            self.transition_start = frame_start
+        profiler.mark('switch')
+        
+        self.current_scene.handle_events(events)
+        if self.current_scene.next_scene and self.transition_start is None:
+            # 本帧的事件触发了切换，记下新场景的构造耗时
+            self.transition_ms = (time.perf_counter() - frame_start) * 1000
+        profiler.mark('events')
+        self.current_scene.timeline.update(self.time_source())
+        self.current_scene.update()
+        profiler.mark('update')
+        self.render()
+        self.input.frame_presented(time.perf_counter())
+        if self.transition_start is not None:
+            self.record_transition(self.last_scene, self.current_scene,
+                                   self.transition_ms + (time.perf_counter() - self.transition_start) * 1000)
+            self.transition_start = None
+            self.transition_ms = 0
+        profiler.end_frame(self.current_scene.node.id)
+        return (time.perf_counter() - frame_start) * 1000
+    
+    def wait_next_frame(self):
+        if self.current_scene.is_animating() or self.current_scene.next_scene:
+            self.clock.tick(self.fps)
+        else:
+            self.wait_idle()
+
+    def render(self):
+        """绘制当前场景；脏矩形模式下只重绘并上传变化的区域，画面没变化时什么都不做"""
+        profiler = self.profiler
+        if profiler.overlay:
+            # 叠加层每帧都要重画，先让场景重绘它下面的区域
+            self.current_scene.mark_dirty(profiler.overlay_rect)
+        
+        if not self.dirty_rects:
+            self.current_scene.take_dirty_rects()
             self.current_scene.draw()
-            
+            profiler.mark('draw')
+            self.draw_overlay()
             pygame.display.flip()
-            self.clock.tick(60)
+            profiler.mark('present')
+            self.text.end_frame()
+            return
+        
+        rects = self.current_scene.take_dirty_rects()
+        if rects is None:
+            self.current_scene.draw()
+            profiler.mark('draw')
+            self.draw_overlay()
+            pygame.display.flip()
+        elif rects:
+            self.screen.set_clip(rects[0].unionall(rects[1:]))
+            self.current_scene.draw()
+            self.screen.set_clip(None)
+            profiler.mark('draw')
+            self.draw_overlay()
+            pygame.display.update(rects)
+        else:
+            return
+        profiler.mark('present')
+        self.text.end_frame()
+    
+    def draw_overlay(self):
+        profiler = self.profiler
+        if not profiler.overlay:
+            return
+        means = profiler.phase_means()
+        assets = self.assets.stats()
+        lines = [
+            f"FPS {profiler.fps():.1f}   p95 {profiler.percentile(95):.2f} ms   p99 {profiler.percentile(99):.2f} ms",
+            "  ".join(f"{phase} {means[phase]:.2f}" for phase in ('events', 'update', 'draw', 'present')),
+            f"text cache {self.text.hit_rate():.0%}   assets {assets['entries']} / "
+            f"{assets['used_bytes'] / 2**20:.1f} of {assets['budget_bytes'] / 2**20:.0f} MB "
+            f"(peak {assets['peak_bytes'] / 2**20:.1f}, pinned {assets['pinned_bytes'] / 2**20:.1f})",
+            f"input p95 {self.input.stats()['latency_p95_ms']:.2f} ms   events {self.input.received} "
+            f"-> {self.input.delivered} (coalesced {self.input.coalesced})",
+        ] + self.current_scene.profile_stats()
+        profiler.draw_overlay(self.screen, lines)
+        profiler.mark('overlay')
+
+    def poll_events(self):
+        """取出本帧的事件：唤醒空闲等待的事件在前，之后是队列里的事件"""
+        events = self.pending_events + pygame.event.get()
+        self.pending_events = []
+        return events
+
+    def wait_idle(self):
+        """空闲模式：最多等待一个空闲帧的时间，有事件到达时立即返回"""
+        self.collect_garbage_when_idle()
+        event = pygame.event.wait(int(1000 / self.idle_fps))
+        if event.type != pygame.NOEVENT:
+            # 不放回队列：post 会把它排到等待期间到达的事件后面，轻触的按下、松开顺序就反了
+            self.pending_events.append(event)
+        # 重置时钟，避免下一帧把空闲时间算进帧间隔
+        self.clock.tick()
+
+    def collect_garbage_when_idle(self):
+        """在空闲帧里做完整回收；画面没有动画时多花几毫秒不会被看到"""
+        now = time.perf_counter()
+        if now - self.last_gc < self.gc_interval:
+            return
+        gc.collect()
+        self.last_gc = time.perf_counter()
+
+    def record_transition(self, from_scene, to_scene, latency_ms):
+        from_name = from_scene.node.id
+        to_name = to_scene.node.id
+        self.transition_latencies.append((from_name, to_name, latency_ms))
+        over = " (超过一帧)" if latency_ms > self.frame_budget_ms else ""
+        print(f"Transition {from_name} -> {to_name}: {latency_ms:.1f} ms{over}")
+        # 文字缓存统计是诊断输出（F3 叠加层里也有），只在开启启动报告或帧耗时记录时打印
+        if STARTUP.verbose or self.profiler.frames is not None:
+            text_stats = self.text.stats()
+            print(f"Text cache: hit rate {text_stats['hit_rate']:.1%}, "
+                  f"last frame render {text_stats['last_frame_render_ms']:.2f} ms, "
+                  f"max frame render {text_stats['max_frame_render_ms']:.2f} ms")
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="数字江南·智慧苏州")
+    parser.add_argument("--transparency", choices=TRANSPARENCY_MODES, default='alpha',
+                        help="带透明通道图片的表示方式：逐像素 alpha、colorkey 或不透明")
+    parser.add_argument("--full-redraw", action="store_true",
+                        help="每帧整屏重绘，关闭脏矩形渲染")
+    parser.add_argument("--transcode-video", action="store_true",
+                        help="把视频按显示尺寸转码并缓存后退出（安装时运行）")
+    parser.add_argument("--build-assets", action="store_true",
+                        help="按显示尺寸预先缩放所有图片，生成图片包后退出（安装时运行）")
+    parser.add_argument("--no-asset-bundle", action="store_true",
+                        help="不使用图片包，总是从原图解码")
+    parser.add_argument("--decode-workers", type=int, default=DECODE_WORKERS,
+                        help="并行解码图片的线程数（预取和生成图片包）")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="快速启动：第一帧显示后再初始化音频、检查视频转码和预取资源")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="打印启动各阶段耗时和第一帧时间，以及之后按需导入的模块")
+    parser.add_argument("--kiosk", action="store_true",
+                        help="展台模式：致谢页点击或长时间无操作后回到首页，不退出程序")
+    parser.add_argument("--idle-timeout", type=float, default=90,
+                        help="展台模式下无操作多少秒后回到首页")
+    parser.add_argument("--asset-budget-mb", type=float, default=64,
+                        help="图片缓存的像素内存预算 (MB)，超出时淘汰最久未使用的图片")
+    parser.add_argument("--asset-report", action="store_true",
+                        help="退出时打印图片缓存的驻留情况")
+    parser.add_argument("--profile-csv", metavar="PATH",
+                        help="记录每帧各阶段耗时，退出时写成 CSV")
+    parser.add_argument("--profile-trace", metavar="PATH",
+                        help="记录每帧各阶段耗时，退出时写成 Chrome trace (chrome://tracing)")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    game = Game()
-    game.run()
\ No newline at end of file
+    args = parse_args()
+    STARTUP.verbose = args.startup_report
+    if args.transcode_video:
+        sys.exit(0 if VideoTranscodeCache.transcode(VideoScene.video_path, VideoScene.video_size) else 1)
+    if args.build_assets:
+        Game.build_asset_bundle(workers=args.decode_workers)
+        sys.exit(0)
+    game = Game(transparency=args.transparency, dirty_rects=not args.full_redraw,
+                fast_start=args.fast_start, profile_csv=args.profile_csv,
+                profile_trace=args.profile_trace, kiosk=args.kiosk, idle_timeout=args.idle_timeout,
+                asset_budget_mb=args.asset_budget_mb,
+                asset_bundle=None if args.no_asset_bundle else BUNDLE_FILE,
+                decode_workers=args.decode_workers)
+    try:
+        game.run()
+    finally:
+        # 正常退出和异常退出都要把帧耗时写出去
+        if game.profiler.frames is not None:
+            game.profiler.print_summary()
+            game.profiler.save()
+        if args.asset_report:
+            game.assets.print_residency()
+        game.cleanup()
+        pygame.quit()
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""空闲等待唤醒时事件的顺序"""
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import pygame
+import pytest
+import demo1
+
+
+@pytest.fixture
+def game():
+    game = demo1.Game(fast_start=True)
+    # 拼图场景没有拖动时进入空闲模式，同时接收按下和松开
+    game.input.set_scene(game.scene('puzzle'))
+    pygame.event.clear()
+    yield game
+    game.preloader.stop()
+    pygame.quit()
+
+
+def test_tap_keeps_order_across_wait_idle(game):
+    down = pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(100, 100))
+    up = pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=(100, 100))
+    pygame.event.post(down)
+    pygame.event.post(up)
+    
+    # 按下唤醒空闲等待，松开还留在队列里
+    game.wait_idle()
+    events = [event.type for event in game.poll_events()
+              if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)]
+    assert events == [pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP]
+    assert game.pending_events == []